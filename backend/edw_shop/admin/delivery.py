@@ -7,11 +7,10 @@ from __future__ import unicode_literals
 from django.conf.urls import url
 from django.contrib import admin
 from django.core.urlresolvers import reverse
-from django.db.models import Sum
+from django.db.models import Case, Count, IntegerField, When
 from django.forms import models, widgets, ValidationError
 from django.http import HttpResponse
 from django.template import RequestContext
-from django.template.loader import select_template
 from django.utils import timezone
 from django.utils.html import format_html
 from django.utils.translation import ugettext_lazy as _
@@ -22,6 +21,7 @@ from edw_shop.models.order import OrderItemModel
 from edw_shop.models.delivery import DeliveryModel, DeliveryItemModel
 from edw_shop.modifiers.pool import cart_modifiers_pool
 from edw_shop.serializers.order import OrderDetailSerializer
+from edw_shop.shipping.picking import PickingList
 
 
 class OrderItemForm(models.ModelForm):
@@ -49,8 +49,7 @@ class OrderItemForm(models.ModelForm):
         """
         Returns the quantity already delivered for this order item.
         """
-        aggr = instance.deliveryitem_set.aggregate(delivered=Sum('quantity'))
-        return aggr['delivered'] or 0
+        return instance.delivered_quantity
 
     def clean(self):
         cleaned_data = super(OrderItemForm, self).clean()
@@ -117,6 +116,9 @@ class DeliveryInline(admin.TabularInline):
     fields = ('shipping_id', 'shipping_method', 'delivered_items', 'print_out', 'fulfilled',)
     readonly_fields = ('delivered_items', 'print_out', 'fulfilled',)
 
+    def get_queryset(self, request):
+        return DeliveryItemModel.objects.annotate_deliveries(super(DeliveryInline, self).get_queryset(request))
+
     def get_formset(self, request, obj=None, **kwargs):
         """
         Convert the field `shipping_method` into a select box with all possible shipping methods.
@@ -127,19 +129,20 @@ class DeliveryInline(admin.TabularInline):
         return formset
 
     def get_max_num(self, request, obj=None, **kwargs):
-        qs = self.model.objects.filter(order=obj)
-        if obj.status != 'pick_goods' or qs.filter(fulfilled_at__isnull=True) or obj.unfulfilled_items == 0:
-            return qs.count()
-        return qs.count() + 1
+        aggr = self.model.objects.filter(order=obj).aggregate(
+            count=Count('pk'),
+            pending=Count(Case(When(fulfilled_at__isnull=True, then=1), output_field=IntegerField())))
+        if obj.status != 'pick_goods' or aggr['pending'] or obj.unfulfilled_items == 0:
+            return aggr['count']
+        return aggr['count'] + 1
 
     def has_delete_permission(self, request, obj=None):
         return False
 
     def delivered_items(self, obj):
-        aggr = obj.deliveryitem_set.aggregate(quantity=Sum('quantity'))
-        aggr['quantity'] = aggr['quantity'] or 0
-        aggr.update(items=obj.deliveryitem_set.count())
-        return '{quantity}/{items}'.format(**aggr)
+        if not hasattr(obj, 'delivered_quantity'):
+            obj = DeliveryItemModel.objects.annotate_deliveries(self.model.objects.filter(pk=obj.pk)).get()
+        return '{}/{}'.format(obj.delivered_quantity, obj.delivered_count)
     delivered_items.short_description = _("Quantity/Items")
 
     def print_out(self, obj):
@@ -168,11 +171,23 @@ class DeliveryOrderAdminMixin(object):
         ] + super(DeliveryOrderAdminMixin, self).get_urls()
         return my_urls
 
+    def get_actions(self, request):
+        actions = super(DeliveryOrderAdminMixin, self).get_actions(request)
+        if actions is not None:
+            actions['print_picking_list'] = (
+                self.__class__.print_picking_list, 'print_picking_list', _("Print picking list and packing slips"))
+        return actions
+
+    def print_picking_list(self, request, queryset):
+        """
+        Render one consolidated picking list for all selected orders in status 'pick_goods'.
+        """
+        return HttpResponse(PickingList(queryset).render(request))
+
     def render_delivery_note(self, request, delivery_pk=None):
-        template = select_template([
-            '{}/print/delivery-note.html'.format(app_settings.APP_LABEL.lower()),
-            'shop/print/delivery-note.html'
-        ])
+        from edw_shop.documents import get_document_template
+
+        template = get_document_template('delivery-note')
         delivery = DeliveryModel.objects.get(pk=delivery_pk)
         context = {'request': request, 'render_label': 'print'}
         customer_serializer = app_settings.CUSTOMER_SERIALIZER(delivery.order.customer)
@@ -195,6 +210,8 @@ class DeliveryOrderAdminMixin(object):
 
     def save_related(self, request, form, formsets, change):
         super(DeliveryOrderAdminMixin, self).save_related(request, form, formsets, change)
+        # items may have been canceled or restored
+        form.instance.update_unfulfilled_quantity()
         if hasattr(form.instance, '_transition_to_pack_goods') or (
                 form.instance.status == 'pick_goods' and 'status' not in form.changed_data):
             # merchant clicked on button: "Pack the Goods", "Save and continue" or "Save"
@@ -225,3 +242,5 @@ class DeliveryOrderAdminMixin(object):
                 else:
                     # since no OrderItem was added to this delivery, discard it
                     delivery.delete()
+                if hasattr(orderitem_formset.instance, 'clear_delivery_cache'):
+                    orderitem_formset.instance.clear_delivery_cache()
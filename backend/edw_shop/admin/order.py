@@ -4,16 +4,18 @@ Source: https://github.com/awesto/django-shop/blob/aa1b6e474376c0f10355f0808bb96
 """
 from __future__ import unicode_literals
 
+import re
+from collections import OrderedDict
+
 from django.conf.urls import url
-from django.contrib import admin
+from django.contrib import admin, messages
 from django.core.urlresolvers import reverse, NoReverseMatch
 from django.db.models.fields import Field, FieldDoesNotExist
 from django.forms import widgets
-from django.http import HttpResponse
+from django.http import HttpResponse, StreamingHttpResponse
 from django.template import RequestContext
-from django.template.loader import select_template
 from django.utils.html import format_html
-from django.utils.translation import pgettext_lazy
+from django.utils.translation import ugettext_lazy as _, pgettext_lazy
 
 from fsm_admin.mixins import FSMTransitionMixin
 
@@ -27,9 +29,11 @@ from edw.admin.entity import (
     EntityRelationFilter,
 )
 
+from edw_shop.admin.paginator import ApproximateCountPaginator
 from edw_shop.conf import app_settings
 from edw_shop.models.order import OrderItemModel, OrderPayment
 from edw_shop.modifiers.pool import cart_modifiers_pool
+from edw_shop.rendering import template_registry
 from edw_shop.serializers.order import OrderDetailSerializer
 
 
@@ -69,17 +73,25 @@ class OrderItemInline(admin.StackedInline):
     def has_delete_permission(self, request, obj=None):
         return True
 
+    def get_queryset(self, request):
+        return super(OrderItemInline, self).get_queryset(request).select_related('product__polymorphic_ctype')
+
     def get_max_num(self, request, obj=None, **kwargs):
-        return self.model.objects.filter(order=obj).count()
+        # memoized on the order, since the admin asks for each rendering of the formset
+        if obj is None:
+            return 0
+        if '_items_count' not in obj.__dict__:
+            obj.__dict__['_items_count'] = self.model.objects.filter(order=obj).count()
+        return obj.__dict__['_items_count']
 
     def render_as_html_extra(self, obj):
         #print("render_as_html_extra", obj)
-        item_extra_template = select_template([
-            '{0}/admin/orderitem-{1}-extra.html'.format(app_settings.APP_LABEL, obj.product.product_model),
+        product_model = obj.product.product_model
+        return template_registry.render((app_settings.APP_LABEL, product_model, 'orderitem-extra'), [
+            '{0}/admin/orderitem-{1}-extra.html'.format(app_settings.APP_LABEL, product_model),
             '{0}/admin/orderitem-product-extra.html'.format(app_settings.APP_LABEL),
             'edw_shop/admin/orderitem-product-extra.html',
-        ])
-        return item_extra_template.render(obj.extra)
+        ], obj.extra)
     render_as_html_extra.short_description = pgettext_lazy('admin', "Extra data")
 
 
@@ -102,6 +114,9 @@ class StatusListFilter(admin.SimpleListFilter):
 class BaseOrderAdmin(FSMTransitionMixin, EntityChildModelAdmin):
     list_display = ['get_number', 'uuid', 'customer', 'status_name', 'changed_by_manager', 'get_total', 'created_at']
     list_filter = (StatusListFilter, TermsTreeFilter, 'active', 'changed_by_manager', ('forward_relations__to_entity', EntityRelationFilter))
+    list_select_related = ('customer', 'customer__user')
+    paginator = ApproximateCountPaginator
+    show_full_result_count = False
     fsm_field = ['status']
     #date_hierarchy = 'created_at'
     inlines = [
@@ -123,13 +138,52 @@ class BaseOrderAdmin(FSMTransitionMixin, EntityChildModelAdmin):
     #actions = None
     change_form_template = 'edw_shop/admin/change_form.html'
 
-    def __init__(self, *args, **kwargs):
-        super(BaseOrderAdmin, self).__init__(*args, **kwargs)
-        self.extra_template = select_template([
+    @property
+    def extra_template(self):
+        return template_registry.get_template((app_settings.APP_LABEL, None, 'order-extra'), [
             '{}/admin/order-extra.html'.format(app_settings.APP_LABEL),
             'edw_shop/admin/order-extra.html',
         ])
 
+    def get_actions(self, request):
+        """
+        Offer each transition flagged for the admin backend as action, to move many selected
+        orders at once.
+        """
+        actions = super(BaseOrderAdmin, self).get_actions(request)
+        if actions is not None:
+            for name, label in self.get_bulk_transitions():
+                action_name = 'transition_{}'.format(name)
+                actions[action_name] = (self._make_bulk_transition_action(name), action_name, label)
+        return actions
+
+    def get_bulk_transitions(self):
+        bulk_transitions = OrderedDict()
+        for transition in self.model.get_all_transitions():
+            if transition.custom.get('admin') and transition.name not in bulk_transitions:
+                bulk_transitions[transition.name] = transition.custom.get('button_name', transition.name)
+        return bulk_transitions.items()
+
+    def _make_bulk_transition_action(self, transition_name):
+        def bulk_transition(modeladmin, request, queryset):
+            results = modeladmin.model.objects.bulk_transition(queryset, transition_name, user=request.user)
+            succeeded = [r for r in results if r['error'] is None]
+            if succeeded:
+                modeladmin.message_user(request, _("{} orders have been transitioned.").format(len(succeeded)),
+                                        messages.SUCCESS)
+            for result in results:
+                if result['error'] is not None:
+                    modeladmin.message_user(request, "{number}: {error}".format(**result), messages.WARNING)
+        return bulk_transition
+
+    def _fsm_get_transitions(self, obj, request, perms=None):
+        """
+        Look up the available transitions in the precompiled transition graph, rather than
+        introspecting the model on each rendering.
+        """
+        transitions = obj.get_available_transitions(user=request.user) if obj else []
+        return {field: list(self._filter_admin_transitions(transitions)) for field in self._get_fsm_field_list()}
+
     def get_number(self, obj):
         return obj.get_number()
     get_number.short_description = pgettext_lazy('admin', "Order number")
@@ -175,6 +229,30 @@ class BaseOrderAdmin(FSMTransitionMixin, EntityChildModelAdmin):
             pass
         return search_fields
 
+    # the numbers emitted by `Order.get_number`: the year and a five digit counter
+    order_number_pattern = re.compile(r'^\d{4}-\d{5}$')
+
+    def get_search_results(self, request, queryset, search_term):
+        """
+        Look up order numbers using the unique index on the number field. Otherwise, or if no
+        order has this number, and if `SHOP_ORDER_SEARCH_DOCUMENT` is set, match all search words
+        against the search document.
+        """
+        search_term = search_term.strip()
+        if self.order_number_pattern.match(search_term):
+            try:
+                found = queryset.filter(**self.model.resolve_number(search_term))
+                if found.exists():
+                    return found, False
+            except (TypeError, ValueError):
+                pass  # the order model does not use numbers of this form
+        if search_term and app_settings.ORDER_SEARCH_DOCUMENT:
+            for word in search_term.lower().split():
+                # case sensitive containment on a lowercased column, which is what a trigram index supports
+                queryset = queryset.filter(search_document__contains=word)
+            return queryset, False
+        return super(BaseOrderAdmin, self).get_search_results(request, queryset, search_term)
+
 
 class PrintOrderAdminMixin(object):
     """
@@ -200,6 +278,26 @@ class PrintOrderAdminMixin(object):
         ] + super(PrintOrderAdminMixin, self).get_urls()
         return my_urls
 
+    def get_actions(self, request):
+        actions = super(PrintOrderAdminMixin, self).get_actions(request)
+        if actions is not None:
+            actions['print_confirmations'] = (
+                self.__class__.print_confirmations, 'print_confirmations', _("Print order confirmations"))
+            actions['print_invoices'] = (self.__class__.print_invoices, 'print_invoices', _("Print invoices"))
+        return actions
+
+    def _render_documents(self, request, queryset, document):
+        from edw_shop.documents import BulkDocumentRenderer
+
+        renderer = BulkDocumentRenderer(document, queryset, request=request)
+        return StreamingHttpResponse(renderer.iter_html(), content_type='text/html')
+
+    def print_confirmations(self, request, queryset):
+        return self._render_documents(request, queryset, 'confirmation')
+
+    def print_invoices(self, request, queryset):
+        return self._render_documents(request, queryset, 'invoice')
+
     def _render_letter(self, request, pk, template):
         order = self.get_object(request, pk)
         context = {'request': request, 'render_label': 'print'}
@@ -213,18 +311,14 @@ class PrintOrderAdminMixin(object):
         return HttpResponse(content)
 
     def render_confirmation(self, request, pk=None):
-        template = select_template([
-            '{}/print/order-confirmation.html'.format(app_settings.APP_LABEL.lower()),
-            'edw_shop/print/order-confirmation.html'
-        ])
-        return self._render_letter(request, pk, template)
+        from edw_shop.documents import get_document_template
+
+        return self._render_letter(request, pk, get_document_template('confirmation'))
 
     def render_invoice(self, request, pk=None):
-        template = select_template([
-            '{}/print/invoice.html'.format(app_settings.APP_LABEL.lower()),
-            'edw_shop/print/invoice.html'
-        ])
-        return self._render_letter(request, pk, template)
+        from edw_shop.documents import get_document_template
+
+        return self._render_letter(request, pk, get_document_template('invoice'))
 
     def print_out(self, obj):
         if obj.status == 'pick_goods':
@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
+
+from edw_shop.conf import app_settings
+
+
+class ApproximateCountPaginator(Paginator):
+    """
+    Paginator for changelists of large tables. On PostgreSQL, the number of rows of an unfiltered
+    queryset is taken from the planner's estimate in ``pg_class.reltuples`` instead of running an
+    exact ``COUNT(*)``. Filtered querysets, other databases and tables estimated below
+    `SHOP_ADMIN_APPROXIMATE_COUNT_THRESHOLD` rows are counted exactly.
+    """
+    def get_estimate(self):
+        query = getattr(self.object_list, 'query', None)
+        threshold = app_settings.ADMIN_APPROXIMATE_COUNT_THRESHOLD
+        if query is None or threshold is None or query.where or query.distinct or query.low_mark or query.high_mark:
+            return None
+        connection = connections[self.object_list.db]
+        if connection.vendor != 'postgresql':
+            return None
+        with connection.cursor() as cursor:
+            # resolve the table through the search path, as the queries of the changelist do
+            cursor.execute("SELECT reltuples FROM pg_class WHERE oid = to_regclass(%s)",
+                           [connection.ops.quote_name(self.object_list.model._meta.db_table)])
+            row = cursor.fetchone()
+        if row is None or row[0] < threshold:
+            return None
+        return int(row[0])
+
+    @cached_property
+    def count(self):
+        estimate = self.get_estimate()
+        if estimate is not None:
+            return estimate
+        return super(ApproximateCountPaginator, self).count
@@ -0,0 +1,23 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.contrib import admin
+
+from edw_shop.models.pricing import PriceListItemModel
+
+
+class PriceListItemInline(admin.TabularInline):
+    model = PriceListItemModel
+    raw_id_fields = ('product',)
+    extra = 0
+
+
+class PriceListAdmin(admin.ModelAdmin):
+    """
+    Admin for price lists, to be registered for the materialized ``PriceList`` model.
+    """
+    list_display = ('name', 'priority', 'valid_from', 'valid_until', 'active')
+    list_filter = ('active', 'groups')
+    search_fields = ('name',)
+    filter_horizontal = ('groups',)
+    inlines = (PriceListItemInline,)
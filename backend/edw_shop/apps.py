@@ -22,6 +22,41 @@ class ShopConfig(AppConfig):
 
         #post_transition.connect(order_event_notification)
 
+        # drop the system terms cached by the processes whenever a term changes
+        from django.db.models.signals import post_save, post_delete
+        from edw.models.term import TermModel
+        from edw_shop.models.terms import invalidate_system_terms
+
+        post_save.connect(invalidate_system_terms, sender=TermModel, dispatch_uid='edw_shop_invalidate_system_terms')
+        post_delete.connect(invalidate_system_terms, sender=TermModel, dispatch_uid='edw_shop_invalidate_system_terms')
+
+        # refresh the price index of all processes whenever price lists change
+        from django.db.models.signals import m2m_changed
+        from edw_shop.models.pricing import (
+            PriceListModel, PriceListItemModel, invalidate_price_index, invalidate_price_list_groups)
+
+        for model in (PriceListModel, PriceListItemModel):
+            post_save.connect(invalidate_price_index, sender=model, dispatch_uid='edw_shop_invalidate_price_index')
+            post_delete.connect(invalidate_price_index, sender=model, dispatch_uid='edw_shop_invalidate_price_index')
+        m2m_changed.connect(invalidate_price_list_groups, sender=PriceListModel.groups.through,
+                            dispatch_uid='edw_shop_invalidate_price_list_groups')
+
+        # keep the search documents of the orders in sync with their customers
+        from django.contrib.auth import get_user_model
+        from edw.models.customer import CustomerModel
+        from edw_shop.models.order import refresh_order_search_documents
+
+        post_save.connect(refresh_order_search_documents, sender=CustomerModel,
+                          dispatch_uid='edw_shop_refresh_order_search_documents')
+        post_save.connect(refresh_order_search_documents, sender=get_user_model(),
+                          dispatch_uid='edw_shop_refresh_order_search_documents')
+
+        # forget the transition conditions memoized on an order, once it has been transitioned
+        from django_fsm.signals import post_transition
+        from edw_shop.models.workflow import clear_transition_conditions
+
+        post_transition.connect(clear_transition_conditions, dispatch_uid='edw_shop_clear_transition_conditions')
+
         # add JSONField to the map of customized serializers
         ModelSerializer.serializer_field_mapping[JSONField] = JSONSerializerField
 
@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+"""
+Two-tier cache for product snippets and summaries: a bounded in-process LRU in front of the
+shared Django cache.
+"""
+from __future__ import unicode_literals
+
+import threading
+import time
+from collections import OrderedDict
+
+from django.core.cache import cache as shared_cache
+from django.core.signals import setting_changed
+
+from edw_shop.conf import app_settings
+
+
+_missing = object()
+
+
+class LocalCache(object):
+    """
+    Thread-safe in-process cache holding at most `maxsize` entries, each for at most `ttl` seconds.
+    When full, the least recently used entry is evicted.
+    """
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.evictions = self.expirations = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                value, expires = self._data.pop(key)
+            except KeyError:
+                self.misses += 1
+                return default
+            if expires < time.time():
+                self.expirations += 1
+                self.misses += 1
+                return default
+            # re-insert as the most recently used entry
+            self._data[key] = (value, expires)
+            self.hits += 1
+            return value
+
+    def set(self, key, value, ttl=None):
+        if self.maxsize <= 0:
+            return
+        ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+        with self._lock:
+            self._data.pop(key, None)
+            self._data[key] = (value, time.time() + ttl)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def get_stats(self):
+        return OrderedDict([
+            ('size', len(self._data)),
+            ('maxsize', self.maxsize),
+            ('ttl', self.ttl),
+            ('hits', self.hits),
+            ('misses', self.misses),
+            ('evictions', self.evictions),
+            ('expirations', self.expirations),
+        ])
+
+
+class TwoTierCache(object):
+    """
+    Looks up keys in the in-process `LocalCache` first and then in the shared Django cache,
+    copying the values found in the shared cache into the local one.
+    The local cache is configured by ``SHOP_LOCAL_CACHE_SIZE`` and ``SHOP_LOCAL_CACHE_TTL``, a size
+    of 0 disables it. Since entries of other processes can not be invalidated, the keys must be
+    versioned, for instance by the revision of the product, and the TTL must stay short.
+    The counters are kept per process.
+    """
+    def __init__(self, shared=shared_cache):
+        self.shared = shared
+        self._local = None
+        self.shared_hits = self.shared_misses = 0
+
+    @property
+    def local(self):
+        if self._local is None:
+            self._local = LocalCache(app_settings.LOCAL_CACHE_SIZE, app_settings.LOCAL_CACHE_TTL)
+        return self._local
+
+    def get(self, key, default=None):
+        value = self.local.get(key, _missing)
+        if value is not _missing:
+            return value
+        value = self.shared.get(key, _missing)
+        if value is _missing:
+            self.shared_misses += 1
+            return default
+        self.shared_hits += 1
+        self.local.set(key, value)
+        return value
+
+    def set(self, key, value, timeout=None):
+        self.shared.set(key, value, timeout)
+        self.local.set(key, value, timeout)
+
+    def delete(self, key):
+        self.shared.delete(key)
+        self.local.delete(key)
+
+    def reset(self):
+        """
+        Drop the local cache, it is recreated with the current settings on the next access.
+        """
+        self._local = None
+
+    def get_stats(self):
+        return OrderedDict([
+            ('local', self.local.get_stats()),
+            ('shared_hits', self.shared_hits),
+            ('shared_misses', self.shared_misses),
+        ])
+
+
+product_cache = TwoTierCache()
+
+
+def _reset_product_cache(sender, **kwargs):
+    product_cache.reset()
+
+
+setting_changed.connect(_reset_product_cache, dispatch_uid='edw_shop_reset_product_cache')
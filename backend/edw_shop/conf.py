@@ -252,12 +252,17 @@ class DefaultSettings(object):
     def SHOP_CACHE_DURATIONS(self):
         """
         In the product's list views, HTML snippets are created for the summary representation of
-        each product.
+        each product. The cache keys contain the revision of the product, which changes whenever
+        the product, its units, images or files are saved, hence long durations are safe.
 
-        By default these snippet are cached for one day.
+        The serialized summaries of products in the cart and in orders are cached for the duration
+        ``product_summary``, if it is not ``0``.
+
+        By default these snippet are cached for one day and summaries are not cached.
         """
         result = self._setting('SHOP_CACHE_DURATIONS') or {}
         result.setdefault('product_html_snippet', 86400)
+        result.setdefault('product_summary', 0)
         return result
 
     @property
@@ -270,6 +275,124 @@ class DefaultSettings(object):
         """
         return self._setting('SHOP_DIALOG_FORMS', [])
 
+    @property
+    def SHOP_POST_PURCHASE_ASYNC(self):
+        """
+        If this directive is ``True``, the jobs listed in ``SHOP_POST_PURCHASE_JOBS`` are not invoked
+        while handling the purchase request, but written to a durable queue, which then is processed
+        by the management command ``process_order_jobs``.
+
+        The default is ``False``.
+        """
+        return self._setting('SHOP_POST_PURCHASE_ASYNC', False)
+
+    @property
+    def SHOP_POST_PURCHASE_JOBS(self):
+        """
+        Specify a list of dotted paths to callables, which are invoked as
+        ``handler(order, cart, request, **kwargs)`` after an order has been populated from the cart.
+        """
+        return self._setting('SHOP_POST_PURCHASE_JOBS', ['edw_shop.jobs.handlers.populate_dialog_forms'])
+
+    @property
+    def SHOP_ORDER_JOB_MAX_ATTEMPTS(self):
+        """
+        How often a failing order job is retried before it is marked as failed.
+        """
+        return self._setting('SHOP_ORDER_JOB_MAX_ATTEMPTS', 5)
+
+    @property
+    def SHOP_ORDER_JOB_RETRY_DELAY(self):
+        """
+        Seconds to wait before retrying a failed order job. This delay doubles on each attempt.
+        """
+        return self._setting('SHOP_ORDER_JOB_RETRY_DELAY', 60)
+
+    @property
+    def SHOP_ORDER_JOB_VISIBILITY_TIMEOUT(self):
+        """
+        Seconds after which an order job claimed by a worker, which did not report back, is
+        handed out again.
+        """
+        return self._setting('SHOP_ORDER_JOB_VISIBILITY_TIMEOUT', 600)
+
+    @property
+    def SHOP_SALES_ROLLUPS(self):
+        """
+        If this directive is ``True``, the sales rollup tables (see :mod:`edw_shop.models.sales`)
+        are updated whenever orders are populated or change their status. The models
+        ``DailySales`` and ``ProductSales`` must be materialized then.
+
+        The default is ``False``.
+        """
+        return self._setting('SHOP_SALES_ROLLUPS', False)
+
+    @property
+    def SHOP_PICKING_LIST_ORDERING(self):
+        """
+        The order item fields, by which the lines of a wave picking list are sorted and grouped.
+        Lookups spanning the product, such as ``'product__sku'`` or the storage location of a
+        materialized product model, may be used here.
+
+        The default is ``('product_code', 'product_name')``.
+        """
+        return tuple(self._setting('SHOP_PICKING_LIST_ORDERING', ('product_code', 'product_name')))
+
+    @property
+    def SHOP_ADMIN_APPROXIMATE_COUNT_THRESHOLD(self):
+        """
+        Number of rows, above which the order changelist displays the estimated rather than
+        the exact number of orders, on databases providing such an estimate. Set to ``None`` to
+        always count exactly.
+
+        The default is ``100000``.
+        """
+        return self._setting('SHOP_ADMIN_APPROXIMATE_COUNT_THRESHOLD', 100000)
+
+    @property
+    def SHOP_ORDER_SEARCH_DOCUMENT(self):
+        """
+        If this directive is ``True``, the order admin searches the denormalized column
+        ``search_document`` rather than combining many columns across joins. Run
+        ``manage.py rebuild_order_search`` before enabling it, to fill that column for existing
+        orders and, on PostgreSQL, to create a trigram index on it. The column is maintained while
+        saving orders, customers and users; changes bypassing ``save``, such as ``QuerySet.update``,
+        require to rerun that command.
+
+        The default is ``False``.
+        """
+        return self._setting('SHOP_ORDER_SEARCH_DOCUMENT', False)
+
+    @property
+    def SHOP_LOCAL_CACHE_SIZE(self):
+        """
+        Maximum number of product snippets and summaries kept in the in-process cache, in front of
+        the shared Django cache. Set to ``0`` to disable the in-process cache.
+
+        The default is ``0``.
+        """
+        return self._setting('SHOP_LOCAL_CACHE_SIZE', 0)
+
+    @property
+    def SHOP_LOCAL_CACHE_TTL(self):
+        """
+        Number of seconds an entry is kept in the in-process cache.
+
+        The default is ``60``.
+        """
+        return self._setting('SHOP_LOCAL_CACHE_TTL', 60)
+
+    @property
+    def SHOP_PRICE_LISTS(self):
+        """
+        If this directive is ``True``, ``Product.get_price(request)`` returns the price of the
+        product in the price lists applicable to the customer, falling back to its unit price.
+        The price lists are held in an index per process, refreshed whenever price lists change.
+
+        The default is ``False``.
+        """
+        return self._setting('SHOP_PRICE_LISTS', False)
+
     @property
     def SHOP_CASCADE_FORMS(self):
         """
@@ -0,0 +1,65 @@
+# -*- coding: utf-8 -*-
+"""
+Memoized building of the detail URLs of entities, such as products.
+"""
+from __future__ import unicode_literals
+
+import threading
+
+from django.core.signals import setting_changed
+from django.core.urlresolvers import get_script_prefix, get_urlconf, reverse
+from django.utils.translation import get_language
+
+
+class DetailUrlBuilder(object):
+    """
+    Builds the URLs of the pattern `url_name`, whose last argument is the primary key of an entity.
+    The pattern is reversed only once per combination of the leading arguments (usually the URL
+    of the data mart detail page), script prefix, URLconf and language, with a sentinel in place
+    of the primary key. Further URLs are built by substituting the sentinel.
+    Since the URL of the page is part of the key, moving a page does not require invalidation; the
+    memo is cleared whenever settings change.
+    """
+    sentinel = '9876543210'
+
+    def __init__(self, url_name):
+        self.url_name = url_name
+        self._templates = {}
+        self._lock = threading.Lock()
+
+    def get_template(self, args):
+        key = (args, get_script_prefix(), get_urlconf(), get_language())
+        try:
+            return self._templates[key]
+        except KeyError:
+            pass
+        url = reverse(self.url_name, args=list(args) + [self.sentinel])
+        parts = url.split(self.sentinel)
+        # ``None`` if the sentinel can not be substituted unambiguously
+        template = tuple(parts) if len(parts) == 2 else None
+        with self._lock:
+            self._templates[key] = template
+        return template
+
+    def get_url(self, pk, *args):
+        """
+        Returns the same URL as ``reverse(url_name, args=args + (pk,))``.
+        """
+        template = self.get_template(args)
+        if template is None:
+            return reverse(self.url_name, args=list(args) + [pk])
+        return '{}{}{}'.format(template[0], pk, template[1])
+
+    def clear(self):
+        with self._lock:
+            self._templates.clear()
+
+
+product_detail_urls = DetailUrlBuilder('product_detail')
+
+
+def _clear_detail_urls(sender, **kwargs):
+    product_detail_urls.clear()
+
+
+setting_changed.connect(_clear_detail_urls, dispatch_uid='edw_shop_clear_detail_urls')
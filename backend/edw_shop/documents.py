@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+"""
+Bulk rendering of printable order documents, such as confirmations, invoices and delivery notes.
+"""
+from __future__ import unicode_literals
+
+import multiprocessing
+import zipfile
+
+from django.db import connections
+from django.utils.encoding import force_bytes
+
+from edw_shop.conf import app_settings
+from edw_shop.models.order import OrderModel
+from edw_shop.rendering import template_registry
+from edw_shop.serializers.order import OrderDetailSerializer
+
+
+DOCUMENT_TEMPLATES = {
+    'confirmation': 'order-confirmation.html',
+    'invoice': 'invoice.html',
+    'delivery-note': 'delivery-note.html',
+}
+
+
+def get_document_template(document):
+    """
+    Returns the compiled template for `document`. Templates are looked up and compiled once
+    per process; forked worker processes inherit them from their parent.
+    """
+    app_label = app_settings.APP_LABEL.lower()
+    return template_registry.get_template((app_label, None, 'print-{}'.format(document)), [
+        '{}/print/{}'.format(app_label, DOCUMENT_TEMPLATES[document]),
+        'edw_shop/print/{}'.format(DOCUMENT_TEMPLATES[document]),
+    ])
+
+
+class BulkDocumentRenderer(object):
+    """
+    Renders one document for each of the given orders, delivery notes for each of their fulfilled
+    deliveries. Orders are fetched in chunks together with their customers, items and payments. If
+    `processes` is greater than one, the chunks are rendered by a pool of forked worker processes,
+    otherwise in the current process.
+    """
+    def __init__(self, document, orders, processes=1, chunk_size=50, request=None):
+        if document not in DOCUMENT_TEMPLATES:
+            raise ValueError("Unknown document: {}".format(document))
+        self.document = document
+        self.order_ids = list(orders.order_by('pk').values_list('pk', flat=True)) if hasattr(orders, 'values_list') \
+            else [getattr(order, 'pk', order) for order in orders]
+        self.processes = processes
+        self.chunk_size = chunk_size
+        self.request = request
+
+    @classmethod
+    def get_orders(cls, order_ids):
+        orders = OrderModel.objects.filter(pk__in=order_ids).select_related('customer__user').prefetch_related(
+            'items', 'items__product').order_by('pk')
+        orders = list(orders)
+        OrderModel.get_transition_graph().prefetch_amount_paid(orders)
+        return orders
+
+    @classmethod
+    def get_deliveries(cls, document, orders):
+        """
+        Returns a dictionary mapping the primary keys of `orders` onto the list of their fulfilled
+        deliveries, in the order of fulfillment.
+        """
+        if document != 'delivery-note':
+            return {}
+        from edw_shop.models.delivery import DeliveryModel
+
+        deliveries = {}
+        for delivery in DeliveryModel.objects.filter(order__in=orders, fulfilled_at__isnull=False).order_by(
+                'order', 'fulfilled_at', 'pk'):
+            deliveries.setdefault(delivery.order_id, []).append(delivery)
+        return deliveries
+
+    @classmethod
+    def render_orders(cls, document, order_ids, request=None):
+        """
+        Returns a list of tuples ``(filename, content)`` for the given orders. Delivery notes are
+        rendered once per fulfilled delivery, as they are for a single delivery in the admin backend;
+        orders without any fulfilled delivery get one note without delivery.
+        """
+        template = get_document_template(document)
+        orders = cls.get_orders(order_ids)
+        deliveries = cls.get_deliveries(document, orders)
+        documents = []
+        for order in orders:
+            order_request = request or OrderModel.objects.restore_request(order)
+            context = {'request': order_request, 'render_label': 'print'}
+            customer = app_settings.CUSTOMER_SERIALIZER(order.customer).data
+            data = OrderDetailSerializer(order, context=context).data
+            order_deliveries = deliveries.get(order.pk)
+            for delivery in order_deliveries or [None]:
+                content = template.render({
+                    'customer': customer,
+                    'data': data,
+                    'order': order,
+                    'delivery': delivery,
+                }, order_request)
+                if order_deliveries and len(order_deliveries) > 1:
+                    filename = '{}-{}-{}.html'.format(document, order.get_number(), delivery.pk)
+                else:
+                    filename = '{}-{}.html'.format(document, order.get_number())
+                documents.append((filename, content))
+        return documents
+
+    def get_chunks(self):
+        return [self.order_ids[i:i + self.chunk_size] for i in range(0, len(self.order_ids), self.chunk_size)]
+
+    def __iter__(self):
+        """
+        Yields the tuples ``(filename, content)`` in the order of the primary keys.
+        """
+        if self.processes > 1 and len(self.order_ids) > self.chunk_size:
+            get_document_template(self.document)
+            # database connections must not be shared with the forked processes
+            connections.close_all()
+            pool = multiprocessing.Pool(self.processes)
+            try:
+                for documents in pool.imap(_render_chunk, [(self.document, chunk) for chunk in self.get_chunks()]):
+                    for document in documents:
+                        yield document
+            finally:
+                pool.terminate()
+        else:
+            for chunk in self.get_chunks():
+                for document in self.render_orders(self.document, chunk, self.request):
+                    yield document
+
+    def iter_html(self):
+        """
+        Yields the rendered documents, to be concatenated into one HTML file.
+        """
+        for filename, content in self:
+            yield content
+
+    def write_zip(self, fileobj):
+        """
+        Writes each rendered document as one file into a ZIP archive and returns their number.
+        """
+        count = 0
+        with zipfile.ZipFile(fileobj, 'w', zipfile.ZIP_DEFLATED) as archive:
+            for filename, content in self:
+                archive.writestr(filename, force_bytes(content))
+                count += 1
+        return count
+
+
+def _render_chunk(args):
+    document, order_ids = args
+    return BulkDocumentRenderer.render_orders(document, order_ids)
@@ -0,0 +1,324 @@
+# -*- coding: utf-8 -*-
+"""
+Streaming importer for catalogs (``import.xml``) and offers (``offers.xml``) in the CommerceML 2
+format, as exported by 1C. Products are matched by their field ``sid`` onto the ``Ид`` of the
+``Товар`` or ``Предложение`` elements.
+"""
+from __future__ import unicode_literals
+
+import io
+import json
+import os
+from collections import OrderedDict
+from decimal import Decimal, InvalidOperation
+from xml.etree.ElementTree import iterparse
+
+from django.db import transaction
+from django.utils import timezone
+from django.utils.encoding import force_text
+from django.utils.text import slugify
+
+from edw.models.term import TermModel
+
+from edw_shop.models.product import ProductModel, update_in_stock_terms
+from edw_shop.models.terms import system_terms
+from edw_shop.models.utils import bulk_set_m2m, bulk_update_fields, _default_system_flags_restriction
+
+
+def _local_name(elem):
+    return elem.tag.rsplit('}', 1)[-1]
+
+
+def _child(elem, name):
+    for child in elem:
+        if _local_name(child) == name:
+            return child
+    return None
+
+
+def _text(elem, name, default=None):
+    child = _child(elem, name)
+    if child is None or child.text is None:
+        return default
+    return child.text.strip()
+
+
+PRICE_EXP = Decimal('.001')
+
+
+def _decimal(value, default=None):
+    if value is None:
+        return default
+    try:
+        return Decimal(value.replace(',', '.').replace(' ', ''))
+    except InvalidOperation:
+        return default
+
+
+class CommerceMLImporter(object):
+    """
+    Imports CommerceML files with ``iterparse``, so that memory consumption does not depend on
+    the size of the catalog. Each element ``Товар`` or ``Предложение`` is discarded as soon as it has
+    been parsed; the parsed products are written in batches of `batch_size`, each batch in its own
+    transaction:
+
+    * existing products are looked up by ``sid`` with one query per batch and changed fields are
+      written with one UPDATE per batch, new products are saved one by one, since multi-table
+      inheritance does not permit ``bulk_create``,
+    * the links onto the category terms, which are created from the ``Классификатор``, are
+      synchronized through the many-to-many table,
+    * the prices of an offer become the unit price and the ``ProductUnit`` tiers, the quantity
+      becomes ``in_stock``; products whose in stock choice flipped are re-tagged in a post-pass
+      at the end of each batch.
+
+    If `state_file` is given, the number of elements processed per file is recorded after each
+    batch, so that an interrupted import resumes behind the last committed batch.
+    """
+    model = ProductModel
+    product_fields = ('product_name', 'sku', 'product_code', 'description', 'unit')
+
+    def __init__(self, batch_size=500, state_file=None, progress=None):
+        self.batch_size = batch_size
+        self.state_file = state_file
+        self.progress = progress
+        self.stats = OrderedDict((key, 0) for key in ('created', 'updated', 'unchanged', 'skipped', 'terms'))
+        self._category_terms = None
+
+    # state handling
+
+    def load_state(self):
+        if self.state_file and os.path.exists(self.state_file):
+            with io.open(self.state_file, encoding='utf-8') as fh:
+                return json.load(fh)
+        return {}
+
+    def save_state(self, path, processed):
+        if not self.state_file:
+            return
+        state = self.load_state()
+        if processed is None:
+            state.pop(path, None)
+        else:
+            state[path] = processed
+        with io.open(self.state_file, 'w', encoding='utf-8') as fh:
+            fh.write(force_text(json.dumps(state)))
+
+    def report(self, message, *args):
+        if self.progress:
+            self.progress(message.format(*args))
+
+    # parsing
+
+    def import_file(self, path):
+        """
+        Import a catalog or an offers file. The kind of file is determined by its content.
+        """
+        path = os.path.abspath(path)
+        skip = self.load_state().get(path, 0)
+        if skip:
+            self.report("Resuming {} behind element {}.", path, skip)
+        processed, batch, groups, stack, write = 0, [], [], [], None
+        handlers = {'Товар': (self.parse_product, self.write_products),
+                    'Предложение': (self.parse_offer, self.write_offers)}
+        for event, elem in iterparse(path, events=('start', 'end')):
+            if event == 'start':
+                stack.append(elem)
+                continue
+            stack.pop()
+            name = _local_name(elem)
+            if name == 'Группа' and any(_local_name(e) == 'Классификатор' for e in stack):
+                parents = [e for e in stack if _local_name(e) == 'Группа']
+                groups.append((len(parents), _text(elem, 'Ид'), _text(elem, 'Наименование'),
+                               _text(parents[-1], 'Ид') if parents else None))
+            elif name == 'Классификатор':
+                self.write_categories(groups)
+                groups = []
+            elif name in handlers:
+                parse, write = handlers[name]
+                processed += 1
+                if processed > skip:
+                    batch.append(parse(elem))
+                if len(batch) >= self.batch_size:
+                    self.flush(path, write, batch, processed)
+                    batch = []
+            else:
+                continue
+            # discard the parsed element, to keep the memory consumption constant
+            elem.clear()
+            if stack:
+                stack[-1].remove(elem)
+        if batch:
+            self.flush(path, write, batch, processed)
+        self.save_state(path, None)
+        self.report("Finished {}: {}", path, ', '.join('{} {}'.format(v, k) for k, v in self.stats.items()))
+        return self.stats
+
+    def flush(self, path, write, batch, processed):
+        with transaction.atomic():
+            write(batch)
+        self.save_state(path, processed)
+        self.report("{} elements processed: {}", processed,
+                    ', '.join('{} {}'.format(v, k) for k, v in self.stats.items()))
+
+    def parse_product(self, elem):
+        data = {
+            'sid': _text(elem, 'Ид'),
+            'product_name': _text(elem, 'Наименование', ''),
+            'sku': _text(elem, 'Артикул', ''),
+            'description': _text(elem, 'Описание'),
+        }
+        code = _text(elem, 'Код')
+        if code:
+            data['product_code'] = code
+        unit = _child(elem, 'БазоваяЕдиница')
+        if unit is not None:
+            data['unit'] = (unit.get('НаименованиеПолное') or unit.text or '').strip()[:50]
+        groups = _child(elem, 'Группы')
+        if groups is not None:
+            data['groups'] = [child.text.strip() for child in groups if _local_name(child) == 'Ид' and child.text]
+        return data
+
+    def parse_offer(self, elem):
+        data = {'sid': (_text(elem, 'Ид') or '').split('#')[0], 'prices': []}
+        prices = _child(elem, 'Цены')
+        for price in (prices if prices is not None else []):
+            value = _decimal(_text(price, 'ЦенаЗаЕдиницу'))
+            if value is None:
+                continue
+            data['prices'].append({
+                'value': value,
+                'unit': _text(price, 'Единица', ''),
+                'factor': _decimal(_text(price, 'Коэффициент'), Decimal(1)) or Decimal(1),
+            })
+        quantity = _decimal(_text(elem, 'Количество'))
+        if quantity is not None:
+            data['in_stock'] = int(quantity)
+        return data
+
+    # writing
+
+    @property
+    def category_terms(self):
+        """
+        Map of CommerceML group identifiers onto the primary keys of their terms, which are the
+        descendants of the term with the slug ``CATEGORY_TERM_PATTERN``.
+        """
+        if self._category_terms is None:
+            root = self.get_category_root()
+            self._category_terms = dict(root.get_descendants(include_self=False).values_list('slug', 'id'))
+        return self._category_terms
+
+    def get_category_root(self):
+        root, created = TermModel.objects.get_or_create(
+            slug=self.model.CATEGORY_TERM_PATTERN,
+            parent=system_terms.get_model_wrapper(self.model),
+            defaults={
+                'name': force_text(self.model._meta.verbose_name_plural),
+                'semantic_rule': TermModel.OR_RULE,
+                'system_flags': _default_system_flags_restriction,
+            })
+        return root
+
+    def write_categories(self, groups):
+        """
+        Create or rename the terms for the groups of the ``Классификатор``, parents before children.
+        Terms form a tree, hence they are saved one by one.
+        """
+        root_id = self.get_category_root().id
+        names = dict(TermModel.objects.filter(id__in=self.category_terms.values()).values_list('id', 'name'))
+        with transaction.atomic():
+            for depth, guid, name, parent_guid in sorted(groups, key=lambda group: group[0]):
+                if not guid:
+                    continue
+                term_id = self.category_terms.get(guid)
+                if term_id is None:
+                    term = TermModel(slug=guid, name=name or guid, semantic_rule=TermModel.OR_RULE,
+                                     parent_id=self.category_terms.get(parent_guid, root_id),
+                                     system_flags=_default_system_flags_restriction)
+                    term.save()
+                    self.category_terms[guid] = term.id
+                    self.stats['terms'] += 1
+                elif name and names.get(term_id) != name:
+                    term = TermModel.objects.get(id=term_id)
+                    term.name = name
+                    term.save()
+        self.report("{} categories imported.", len(groups))
+
+    def get_products(self, sids):
+        return dict((product.sid, product) for product in self.model.objects.filter(sid__in=sids))
+
+    def write_products(self, batch):
+        products = self.get_products([data['sid'] for data in batch if data['sid']])
+        changed, links = OrderedDict(), {}
+        for data in batch:
+            sid, groups = data.pop('sid'), data.pop('groups', None)
+            if not sid:
+                self.stats['skipped'] += 1
+                continue
+            product = products.get(sid)
+            if product is None:
+                product = self.model(sid=sid, **data)
+                product.slug = slugify(data['product_name'])[:50] or slugify(sid)[:50]
+                product.save()
+                products[sid] = product
+                self.stats['created'] += 1
+            elif any(getattr(product, field) != value for field, value in data.items()):
+                for field, value in data.items():
+                    setattr(product, field, value)
+                changed[product.pk] = product
+            else:
+                self.stats['unchanged'] += 1
+            if groups is not None:
+                links[product.pk] = set(self.category_terms[guid] for guid in groups if guid in self.category_terms)
+        self.update_products(changed.values(), self.product_fields)
+        bulk_set_m2m(self.model, 'terms', links, scope=self.category_terms.values())
+
+    def update_products(self, products, fields):
+        products = list(products)
+        if products:
+            bulk_update_fields(self.model, products, fields)
+            self.model.objects.filter(pk__in=[p.pk for p in products]).update(updated_at=timezone.now())
+            self.stats['updated'] += len(products)
+
+    def write_offers(self, batch):
+        products = self.get_products([data['sid'] for data in batch if data['sid']])
+        changed, flipped, units = OrderedDict(), [], {}
+        for data in batch:
+            product = products.get(data['sid'])
+            if product is None:
+                self.stats['skipped'] += 1
+                continue
+            values = {}
+            prices = sorted(data['prices'], key=lambda price: price['factor'])
+            if prices:
+                base = prices[0]
+                values['unit_price'] = (base['value'] / base['factor']).quantize(PRICE_EXP)
+                units[product.pk] = [{
+                    'uuid': price['unit'] or force_text(price['factor']),
+                    'name': price['unit'] or force_text(price['factor']),
+                    'value': price['factor'],
+                    'discount': (values['unit_price'] - price['value'] / price['factor']).quantize(PRICE_EXP),
+                } for price in prices[1:]]
+            if 'in_stock' in data:
+                values['in_stock'] = data['in_stock']
+                if (self.model.get_in_stock_choice(product.in_stock)[0] !=
+                        self.model.get_in_stock_choice(data['in_stock'])[0]):
+                    flipped.append(product)
+            if any(getattr(product, field) != value for field, value in values.items()):
+                for field, value in values.items():
+                    setattr(product, field, value)
+                changed[product.pk] = product
+            else:
+                self.stats['unchanged'] += 1
+        self.update_products(changed.values(), ('unit_price', 'in_stock'))
+        self.write_units(units)
+        # post-pass: re-tag the products whose in stock choice flipped
+        update_in_stock_terms(flipped, self.model)
+
+    def write_units(self, units):
+        """
+        Synchronize the ``ProductUnit`` tiers of many products: one query to load the existing
+        units, and at most one INSERT, one UPDATE and one DELETE per batch.
+        """
+        unit_model = self.model._meta.get_field('units').related_model
+        unit_model.objects.sync_many(units)
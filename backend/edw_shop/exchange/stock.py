@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+"""
+Bulk update of the quantity in stock and of the price of products from stock and price feeds.
+"""
+from __future__ import unicode_literals
+
+import csv
+import io
+import json
+from collections import OrderedDict
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.utils import six, timezone
+from django.utils.encoding import force_text
+
+from edw_shop.models.product import ProductModel, get_in_stock_terms, update_in_stock_terms
+from edw_shop.models.utils import bulk_update_fields
+
+
+class StockUpdater(object):
+    """
+    Applies rows such as ``{'sid': '00-123', 'in_stock': 5, 'unit_price': '10.50'}`` onto the
+    products found by the column `key`, which is one of ``sid``, ``sku`` or ``id``.
+    Each batch of `batch_size` rows costs one query to load the products and one UPDATE for the
+    changed products, without calling ``Product.save``. Afterwards the in stock terms are
+    re-tagged, but only for the products whose in stock choice flipped.
+    """
+    keys = ('sid', 'sku', 'id')
+    fields = ('in_stock', 'unit_price')
+
+    def __init__(self, key='sid', model=ProductModel, batch_size=500):
+        if key not in self.keys:
+            raise ValueError("Unknown key `{}`, expected one of {}.".format(key, ', '.join(self.keys)))
+        self.key = key
+        self.model = model
+        self.batch_size = batch_size
+        self.stats = OrderedDict((name, 0) for name in ('updated', 'unchanged', 'not_found', 'invalid', 'flipped'))
+        self.errors = []
+        self._in_stock_terms = None
+
+    @property
+    def in_stock_terms(self):
+        if self._in_stock_terms is None:
+            self._in_stock_terms = get_in_stock_terms(self.model)
+        return self._in_stock_terms
+
+    def clean_row(self, row):
+        """
+        Returns the key and the dictionary of field values of `row`, converted by the model fields.
+        Raises ``ValidationError`` if the row is malformed.
+        """
+        if not isinstance(row, dict):
+            raise ValidationError("Expected an object.")
+        key_value = row.get(self.key, None)
+        if key_value in (None, ''):
+            raise ValidationError({self.key: ["This field is required."]})
+        values, errors = {}, {}
+        for name in self.fields:
+            if name not in row:
+                continue
+            field = self.model._meta.get_field(name)
+            value = row[name]
+            if value in (None, ''):
+                if not field.null:
+                    errors[name] = [force_text(field.error_messages['null'])]
+                    continue
+                value = None
+            try:
+                values[name] = field.clean(value, None)
+            except ValidationError as e:
+                errors[name] = e.messages
+        if errors:
+            raise ValidationError(errors)
+        if not values:
+            raise ValidationError("No field to update, expected one of {}.".format(', '.join(self.fields)))
+        return force_text(key_value), values
+
+    def update(self, rows):
+        """
+        Apply the iterable `rows` and return the statistics. The rows which could not be applied
+        are reported in `errors` by their index.
+        """
+        batch = []
+        for index, row in enumerate(rows):
+            try:
+                batch.append(self.clean_row(row))
+            except ValidationError as e:
+                self.stats['invalid'] += 1
+                self.errors.append({'index': index, 'errors': e.message_dict if hasattr(e, 'error_dict') else e.messages})
+                continue
+            if len(batch) >= self.batch_size:
+                self.write_batch(batch)
+                batch = []
+        if batch:
+            self.write_batch(batch)
+        return self.stats
+
+    def get_products(self, key_values):
+        products = OrderedDict()
+        if self.key == 'id':
+            key_values = [value for value in key_values if value.isdigit()]
+        for product in self.model.objects.filter(**{'{}__in'.format(self.key): key_values}):
+            products.setdefault(force_text(getattr(product, self.key)), []).append(product)
+        return products
+
+    def write_batch(self, batch):
+        products = self.get_products(set(key_value for key_value, values in batch))
+        changed, flipped = OrderedDict(), OrderedDict()
+        for key_value, values in batch:
+            if key_value not in products:
+                self.stats['not_found'] += 1
+                continue
+            for product in products[key_value]:
+                if not any(getattr(product, name) != value for name, value in values.items()):
+                    self.stats['unchanged'] += 1
+                    continue
+                if 'in_stock' in values and (self.model.get_in_stock_choice(product.in_stock)[0] !=
+                                             self.model.get_in_stock_choice(values['in_stock'])[0]):
+                    flipped[product.pk] = product
+                for name, value in values.items():
+                    setattr(product, name, value)
+                changed[product.pk] = product
+        if not changed:
+            return
+        with transaction.atomic():
+            bulk_update_fields(self.model, changed.values(), self.fields)
+            self.model.objects.filter(pk__in=list(changed.keys())).update(updated_at=timezone.now())
+            # products still in the same bucket keep their in stock terms
+            if flipped:
+                update_in_stock_terms(flipped.values(), self.model, self.in_stock_terms)
+        self.stats['updated'] += len(changed)
+        self.stats['flipped'] += len(flipped)
+
+
+def iter_rows(path):
+    """
+    Yields the rows of a CSV file with a header line, or of a JSON Lines file if the name of
+    `path` ends with ``.jsonl``.
+    """
+    if path.endswith('.jsonl'):
+        with io.open(path, encoding='utf-8') as stream:
+            for line in stream:
+                if line.strip():
+                    yield json.loads(line)
+    elif six.PY2:
+        with open(path, 'rb') as stream:
+            for row in csv.DictReader(stream):
+                yield dict((force_text(k), force_text(v)) for k, v in row.items())
+    else:
+        with io.open(path, encoding='utf-8', newline='') as stream:
+            for row in csv.DictReader(stream):
+                yield row
@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+"""
+Streaming export of orders, their items and payments for accounting integrations.
+"""
+from __future__ import unicode_literals
+
+import csv
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+from django.utils import six
+from django.utils.encoding import force_bytes, force_text
+
+from edw_shop.models.order import OrderModel, OrderItemModel, OrderPayment
+
+
+class OrderExporter(object):
+    """
+    Iterates over orders ordered by their modification time. Orders are fetched in chunks using
+    keyset pagination on ``(updated_at, pk)``; the items and payments of each chunk are fetched
+    with one query each, so that memory consumption is bounded by the chunk size.
+    """
+    ITEM_FIELDS = ['product_id', 'product_code', 'product_name', 'quantity', '_unit_price', '_line_total']
+
+    def __init__(self, queryset=None, since=None, since_pk=None, chunk_size=500):
+        self.queryset = OrderModel.objects.all() if queryset is None else queryset
+        self.last_updated_at, self.last_pk = since, since_pk
+        self.chunk_size = chunk_size
+
+    def get_order_data(self, order):
+        return {
+            'id': order.pk,
+            'number': order.get_number(),
+            'status': order.status,
+            'customer': order.customer_id,
+            'currency': order.currency,
+            'subtotal': order._subtotal,
+            'total': order._total,
+            'created_at': order.created_at,
+            'updated_at': order.updated_at,
+        }
+
+    def get_item_data(self, item):
+        return {
+            'product': item['product_id'],
+            'product_code': item['product_code'],
+            'product_name': item['product_name'],
+            'quantity': item['quantity'],
+            'unit_price': item['_unit_price'],
+            'line_total': item['_line_total'],
+        }
+
+    def get_payment_data(self, payment):
+        return {
+            'amount': payment['amount'],
+            'transaction_id': payment['transaction_id'],
+            'payment_method': payment['payment_method'],
+            'created_at': payment['created_at'],
+        }
+
+    def iter_chunks(self):
+        queryset = self.queryset.order_by('updated_at', 'pk')
+        while True:
+            chunk = queryset
+            if self.last_updated_at is not None:
+                chunk = chunk.filter(Q(updated_at__gt=self.last_updated_at) |
+                                     Q(updated_at=self.last_updated_at, pk__gt=self.last_pk or 0))
+            orders = list(chunk[:self.chunk_size])
+            if not orders:
+                return
+            yield orders
+            self.last_updated_at, self.last_pk = orders[-1].updated_at, orders[-1].pk
+            if len(orders) < self.chunk_size:
+                return
+
+    def __iter__(self):
+        """
+        Yields one dictionary per order, containing its items and payments.
+        """
+        for orders in self.iter_chunks():
+            order_ids = [order.pk for order in orders]
+            items, payments = {}, {}
+            item_rows = OrderItemModel.objects.filter(order_id__in=order_ids).order_by('order_id', 'pk').values(
+                'order_id', *self.ITEM_FIELDS).iterator()
+            for row in item_rows:
+                items.setdefault(row['order_id'], []).append(self.get_item_data(row))
+            payment_rows = OrderPayment.objects.filter(order_id__in=order_ids).order_by('order_id', 'pk').values(
+                'order_id', 'amount', 'transaction_id', 'payment_method', 'created_at').iterator()
+            for row in payment_rows:
+                payments.setdefault(row['order_id'], []).append(self.get_payment_data(row))
+            for order in orders:
+                data = self.get_order_data(order)
+                data.update(items=items.get(order.pk, []), payments=payments.get(order.pk, []))
+                yield data
+
+
+class Echo(object):
+    """
+    File-like object, which just returns what is written into it.
+    """
+    def write(self, value):
+        return value
+
+
+class JSONLinesWriter(object):
+    """
+    Renders each order as one line of JSON.
+    """
+    content_type = 'application/x-ndjson'
+    extension = 'jsonl'
+
+    def iter_lines(self, exporter):
+        for data in exporter:
+            yield json.dumps(data, cls=DjangoJSONEncoder, ensure_ascii=False) + '\n'
+
+
+class CSVWriter(object):
+    """
+    Renders one row per order item, repeating the order's columns. Orders without items are
+    rendered as one row with empty item columns.
+    """
+    content_type = 'text/csv'
+    extension = 'csv'
+
+    ORDER_COLUMNS = ['id', 'number', 'status', 'customer', 'currency', 'subtotal', 'total', 'amount_paid',
+                     'created_at', 'updated_at']
+    ITEM_COLUMNS = ['product', 'product_code', 'product_name', 'quantity', 'unit_price', 'line_total']
+
+    def _encode(self, row):
+        row = ['' if value is None else force_text(value) for value in row]
+        if six.PY2:
+            row = [force_bytes(value) for value in row]
+        return row
+
+    def iter_lines(self, exporter):
+        writer = csv.writer(Echo())
+        yield force_text(writer.writerow(self._encode(self.ORDER_COLUMNS + self.ITEM_COLUMNS)))
+        for data in exporter:
+            data['amount_paid'] = sum(payment['amount'] for payment in data['payments'])
+            order_row = [data[column] for column in self.ORDER_COLUMNS]
+            for item in data['items'] or [{}]:
+                row = order_row + [item.get(column) for column in self.ITEM_COLUMNS]
+                yield force_text(writer.writerow(self._encode(row)))
+
+
+EXPORT_WRITERS = {
+    'csv': CSVWriter,
+    'jsonl': JSONLinesWriter,
+}
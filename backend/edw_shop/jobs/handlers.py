@@ -0,0 +1,28 @@
+# -*- coding: utf-8 -*-
+"""
+Post purchase job handlers. Each handler is invoked as ``handler(order, cart, request, status=...)``,
+where `status` is the status of the order on the moment of purchase, either directly from
+``BaseOrder.populate_from_cart`` or by the order job workers, if ``SHOP_POST_PURCHASE_ASYNC`` is
+enabled. In the latter case ``cart`` is an unsaved cart restored with its addresses, extra data,
+subtotal, total and extra rows, and ``request`` is emulated from ``order.stored_request``.
+Since jobs are processed at least once, handlers should be idempotent.
+"""
+from __future__ import unicode_literals
+
+
+def populate_dialog_forms(order, cart, request, **kwargs):
+    """
+    Let each dialog form transfer its data from the cart into the order.
+    """
+    order.populate_dialog_forms(cart, request)
+
+
+def update_sales_rollups(order, cart, request, status=None, **kwargs):
+    """
+    Add the order to the sales rollups of the status it had on the moment of purchase. Later
+    transitions are applied by ``BaseOrder.save``, regardless whether they happen before this job.
+    A job delivered twice counts the order twice, ``manage.py rebuild_sales_rollups`` repairs that.
+    """
+    from edw_shop.models import sales
+
+    sales.update_sales_rollups([(order, None, status or order.status)])
@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import logging
+import os
+import socket
+import sys
+import threading
+
+from django.db import connection
+
+from edw_shop.models.job import OrderJobModel
+
+
+logger = logging.getLogger('edw_shop.jobs')
+
+
+class OrderJobWorker(threading.Thread):
+    """
+    Thread claiming and executing order jobs until it is stopped.
+    """
+    def __init__(self, pool, index):
+        super(OrderJobWorker, self).__init__(name='order-job-worker-{}'.format(index))
+        self.daemon = True
+        self.pool = pool
+        self.worker_id = '{}:{}:{}'.format(socket.gethostname(), os.getpid(), index)
+
+    def run(self):
+        try:
+            while not self.pool.stopped.is_set():
+                processed = self.process_batch()
+                if not processed:
+                    if self.pool.once:
+                        break
+                    self.pool.stopped.wait(self.pool.poll_interval)
+        finally:
+            connection.close()
+
+    def process_batch(self):
+        jobs = OrderJobModel.objects.claim(self.pool.batch_size, worker=self.worker_id)
+        for job in jobs:
+            try:
+                job.execute()
+            except Exception:
+                logger.exception("Order job %s failed on attempt %s", job.pk, job.attempts)
+                job.fail(sys.exc_info())
+            else:
+                job.succeed()
+        return len(jobs)
+
+
+class OrderJobWorkerPool(object):
+    """
+    A local pool of threads processing the durable order job queue.
+    """
+    def __init__(self, workers=2, batch_size=10, poll_interval=2.0, once=False):
+        self.workers = workers
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.once = once
+        self.stopped = threading.Event()
+        self.threads = []
+
+    def start(self):
+        self.threads = [OrderJobWorker(self, index) for index in range(self.workers)]
+        for thread in self.threads:
+            thread.start()
+
+    def stop(self):
+        self.stopped.set()
+
+    def join(self):
+        # join with a timeout, so that the main thread stays responsive to KeyboardInterrupt
+        while any(thread.is_alive() for thread in self.threads):
+            for thread in self.threads:
+                thread.join(0.5)
+
+    def run(self):
+        self.start()
+        try:
+            self.join()
+        except KeyboardInterrupt:
+            self.stop()
+            self.join()
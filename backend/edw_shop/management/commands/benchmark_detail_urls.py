@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import timeit
+
+from django.core.management.base import BaseCommand, CommandError
+from django.core.urlresolvers import reverse
+
+from edw_shop.detail_urls import product_detail_urls
+from edw_shop.models.product import ProductModel
+
+
+class Command(BaseCommand):
+    help = "Compare the time for building product detail URLs with reverse() and with the memoized builder."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--count', type=int, default=10000,
+                            help="Number of URLs to build with each method.")
+
+    def handle(self, *args, **options):
+        product = ProductModel.objects.active().first()
+        if product is None:
+            raise CommandError("No active product found.")
+        url_args = []
+        data_mart = product.data_mart
+        page = data_mart.get_cached_detail_page() if data_mart else None
+        if page is not None:
+            url_args.append(page.url.strip('/'))
+
+        pk = product.pk
+        if product_detail_urls.get_url(pk, *url_args) != reverse('product_detail', args=url_args + [pk]):
+            raise CommandError("The builder and reverse() return different URLs.")
+        count = options['count']
+        results = [
+            ('reverse', timeit.timeit(lambda: reverse('product_detail', args=url_args + [pk]), number=count)),
+            ('builder', timeit.timeit(lambda: product_detail_urls.get_url(pk, *url_args), number=count)),
+        ]
+        for name, seconds in results:
+            self.stdout.write("{:8} {:.3f}s for {} URLs, {:.2f}µs per URL".format(
+                name, seconds, count, seconds * 1e6 / count))
+        self.stdout.write("speedup  {:.1f}x".format(results[0][1] / results[1][1] if results[1][1] else 0))
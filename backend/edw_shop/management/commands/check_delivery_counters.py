@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from edw_shop.models.delivery import DeliveryItemModel
+from edw_shop.models.order import OrderModel, OrderItemModel
+from edw_shop.models.utils import bulk_update_fields
+
+
+class Command(BaseCommand):
+    help = "Compare the delivered and unfulfilled quantity counters with the delivery items and optionally repair them."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repair', action='store_true', default=False,
+                            help="Write the recomputed counters into the database.")
+        parser.add_argument('--chunk-size', type=int, default=500,
+                            help="Number of orders checked at once.")
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        order_ids = list(OrderModel.objects.order_by('pk').values_list('pk', flat=True))
+        can_cancel = any(f.attname == 'canceled' for f in OrderItemModel._meta.fields)
+        broken_items = broken_orders = 0
+        for start in range(0, len(order_ids), chunk_size):
+            chunk = order_ids[start:start + chunk_size]
+            with transaction.atomic():
+                orders = list(OrderModel.objects.filter(pk__in=chunk).select_for_update())
+                items = list(OrderItemModel.objects.filter(order__in=chunk))
+                delivered = DeliveryItemModel.objects.delivered_quantities(items)
+                unfulfilled = dict((order.pk, Decimal(0)) for order in orders)
+                stale_items = []
+                for item in items:
+                    quantity = Decimal(delivered.get(item.pk) or 0)
+                    if item.delivered_quantity != quantity:
+                        item.delivered_quantity = quantity
+                        stale_items.append(item)
+                    if not (can_cancel and item.canceled):
+                        unfulfilled[item.order_id] += item.quantity - quantity
+                stale_orders = []
+                for order in orders:
+                    if order.unfulfilled_quantity != unfulfilled[order.pk]:
+                        order.unfulfilled_quantity = unfulfilled[order.pk]
+                        stale_orders.append(order)
+                for obj in stale_items + stale_orders:
+                    self.stdout.write("Inconsistent counter on {!r}".format(obj))
+                if options['repair']:
+                    bulk_update_fields(OrderItemModel, stale_items, ['delivered_quantity'])
+                    bulk_update_fields(OrderModel, stale_orders, ['unfulfilled_quantity'])
+                broken_items += len(stale_items)
+                broken_orders += len(stale_orders)
+
+        msg = "Found {} order items and {} orders with inconsistent counters."
+        self.stdout.write(msg.format(broken_items, broken_orders))
+        if options['repair'] and (broken_items or broken_orders):
+            self.stdout.write("The counters have been repaired.")
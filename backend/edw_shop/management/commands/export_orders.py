@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import io
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_datetime
+
+from edw_shop.export import EXPORT_WRITERS, OrderExporter
+from edw_shop.models.export import ExportCheckpointModel
+
+
+class Command(BaseCommand):
+    help = "Stream orders including their items and payments as CSV or JSON Lines."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', dest='export_format', choices=sorted(EXPORT_WRITERS.keys()), default='jsonl')
+        parser.add_argument('--output', default=None,
+                            help="File to write into, defaults to the standard output.")
+        parser.add_argument('--checkpoint', default=None,
+                            help="Name of the checkpoint used for incremental exports. Only orders updated "
+                                 "after the previous run are exported and the checkpoint is advanced afterwards.")
+        parser.add_argument('--since', default=None,
+                            help="Only export orders updated after this timestamp (ISO 8601).")
+        parser.add_argument('--chunk-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        since, since_pk = None, None
+        if options['since']:
+            since = parse_datetime(options['since'])
+            if since is None:
+                raise CommandError("Invalid timestamp: {}".format(options['since']))
+        elif options['checkpoint']:
+            checkpoint, created = ExportCheckpointModel.objects.get_or_create(name=options['checkpoint'])
+            since, since_pk = checkpoint.last_updated_at, checkpoint.last_pk
+
+        exporter = OrderExporter(since=since, since_pk=since_pk, chunk_size=options['chunk_size'])
+        writer = EXPORT_WRITERS[options['export_format']]()
+        if options['output']:
+            stream = io.open(options['output'], 'w', encoding='utf-8', newline='')
+        else:
+            stream = self.stdout
+            self.stdout.ending = ''
+        count = 0
+        try:
+            for line in writer.iter_lines(exporter):
+                stream.write(line)
+                count += 1
+        finally:
+            if options['output']:
+                stream.close()
+            else:
+                self.stdout.ending = '\n'
+
+        if options['checkpoint'] and exporter.last_updated_at is not None:
+            ExportCheckpointModel.objects.update_or_create(name=options['checkpoint'], defaults={
+                'last_updated_at': exporter.last_updated_at,
+                'last_pk': exporter.last_pk,
+            })
+        if options['output']:
+            self.stdout.write("Exported {} lines into {}.".format(count, options['output']))
@@ -0,0 +1,23 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.core.management.base import BaseCommand
+
+from edw_shop.exchange.commerceml import CommerceMLImporter
+
+
+class Command(BaseCommand):
+    help = "Import products, categories, prices and stock from CommerceML files (import.xml, offers.xml)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('files', nargs='+',
+                            help="CommerceML files, imported in the given order, usually import.xml before offers.xml.")
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--state-file', default=None,
+                            help="File recording the progress, used to resume an interrupted import.")
+
+    def handle(self, *args, **options):
+        importer = CommerceMLImporter(batch_size=options['batch_size'], state_file=options['state_file'],
+                                      progress=self.stdout.write if options['verbosity'] > 0 else None)
+        for path in options['files']:
+            importer.import_file(path)
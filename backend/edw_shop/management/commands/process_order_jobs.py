@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.core.management.base import BaseCommand
+
+from edw_shop.jobs.worker import OrderJobWorkerPool
+
+
+class Command(BaseCommand):
+    help = "Process the queue of post purchase order jobs."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=2,
+                            help="Number of worker threads.")
+        parser.add_argument('--batch-size', type=int, default=10,
+                            help="Number of jobs claimed by a worker at once.")
+        parser.add_argument('--poll-interval', type=float, default=2.0,
+                            help="Seconds to wait when the queue is empty.")
+        parser.add_argument('--once', action='store_true', default=False,
+                            help="Exit as soon as the queue is drained.")
+
+    def handle(self, *args, **options):
+        pool = OrderJobWorkerPool(
+            workers=options['workers'],
+            batch_size=options['batch_size'],
+            poll_interval=options['poll_interval'],
+            once=options['once'],
+        )
+        pool.run()
@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.core.management.base import BaseCommand
+from django.db import connections, router
+
+from edw_shop.models.order import OrderModel
+from edw_shop.models.utils import bulk_update_fields
+
+
+class Command(BaseCommand):
+    help = "Rebuild the search documents of all orders and create a trigram index on PostgreSQL."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=500)
+        parser.add_argument('--no-index', action='store_false', dest='create_index', default=True,
+                            help="Do not create the trigram index.")
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        order_ids = list(OrderModel.objects.order_by('pk').values_list('pk', flat=True))
+        changed = 0
+        for start in range(0, len(order_ids), chunk_size):
+            orders = []
+            for order in OrderModel.objects.filter(pk__in=order_ids[start:start + chunk_size]).select_related(
+                    'customer__user'):
+                search_document = order.get_search_document()
+                if order.search_document != search_document:
+                    order.search_document = search_document
+                    orders.append(order)
+            bulk_update_fields(OrderModel, orders, ['search_document'])
+            changed += len(orders)
+        self.stdout.write("Updated the search document of {} orders.".format(changed))
+
+        if options['create_index']:
+            self.create_index()
+
+    def create_index(self):
+        connection = connections[router.db_for_write(OrderModel)]
+        if connection.vendor != 'postgresql':
+            self.stdout.write("No trigram index available on {}, searching without index.".format(connection.vendor))
+            return
+        table = OrderModel._meta.db_table
+        with connection.cursor() as cursor:
+            cursor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+            cursor.execute("CREATE INDEX IF NOT EXISTS {0} ON {1} USING gin (search_document gin_trgm_ops)".format(
+                connection.ops.quote_name('{}_search_trgm'.format(table)), connection.ops.quote_name(table)))
+        self.stdout.write("Created the trigram index on {}.search_document.".format(table))
@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDate
+from django.utils.dateparse import parse_date
+
+from edw_shop.models.order import OrderItemModel
+from edw_shop.models.sales import DailySalesModel, ProductSalesModel
+
+
+class Command(BaseCommand):
+    help = "Rebuild the daily and per product sales rollups from the order items."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--since', default=None,
+                            help="Only rebuild the rollups starting from this day (YYYY-MM-DD).")
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        since = parse_date(options['since']) if options['since'] else None
+        batch_size = options['batch_size']
+        items = OrderItemModel.objects.annotate(day=TruncDate('order__created_at'))
+        if since is not None:
+            items = items.filter(day__gte=since)
+
+        with transaction.atomic():
+            for model in (DailySalesModel, ProductSalesModel):
+                rollups = model.objects.all()
+                if since is not None:
+                    rollups = rollups.filter(day__gte=since)
+                rollups.delete()
+
+            rows = items.values('day', 'order__status').annotate(
+                orders=Count('order', distinct=True), quantity=Sum('quantity'), revenue=Sum('_line_total'))
+            DailySalesModel.objects.bulk_create([DailySalesModel(
+                day=row['day'], status=row['order__status'], orders=row['orders'],
+                quantity=row['quantity'] or 0, revenue=row['revenue'] or 0) for row in rows.iterator()],
+                batch_size=batch_size)
+
+            rows = items.values('day', 'order__status', 'product_id').annotate(
+                orders=Count('order', distinct=True), quantity=Sum('quantity'), revenue=Sum('_line_total'))
+            ProductSalesModel.objects.bulk_create([ProductSalesModel(
+                day=row['day'], status=row['order__status'], product_id=row['product_id'], orders=row['orders'],
+                quantity=row['quantity'] or 0, revenue=row['revenue'] or 0) for row in rows.iterator()],
+                batch_size=batch_size)
+
+        self.stdout.write("Sales rollups have been rebuilt.")
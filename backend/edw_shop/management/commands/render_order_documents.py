@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import io
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+
+from edw_shop.documents import DOCUMENT_TEMPLATES, BulkDocumentRenderer
+from edw_shop.models.order import OrderModel
+
+
+class Command(BaseCommand):
+    help = "Render confirmations, invoices or delivery notes for many orders into one HTML file or a ZIP archive."
+
+    def add_arguments(self, parser):
+        parser.add_argument('document', choices=sorted(DOCUMENT_TEMPLATES.keys()))
+        parser.add_argument('--output', required=True,
+                            help="File to write into. Files ending with .zip receive one document per order or delivery.")
+        parser.add_argument('--status', action='append', default=[],
+                            help="Only render orders in this status, may be repeated.")
+        parser.add_argument('--since', default=None,
+                            help="Only render orders created on or after this day (YYYY-MM-DD).")
+        parser.add_argument('--until', default=None,
+                            help="Only render orders created on or before this day (YYYY-MM-DD).")
+        parser.add_argument('--ids', default=None,
+                            help="Comma separated primary keys of the orders to render.")
+        parser.add_argument('--processes', type=int, default=1,
+                            help="Number of worker processes.")
+        parser.add_argument('--chunk-size', type=int, default=50)
+
+    def handle(self, *args, **options):
+        orders = OrderModel.objects.all()
+        if options['status']:
+            orders = orders.filter(status__in=options['status'])
+        for option, lookup in (('since', 'created_at__date__gte'), ('until', 'created_at__date__lte')):
+            if options[option]:
+                day = parse_date(options[option])
+                if day is None:
+                    raise CommandError("Invalid day: {}".format(options[option]))
+                orders = orders.filter(**{lookup: day})
+        if options['ids']:
+            orders = orders.filter(pk__in=[pk for pk in options['ids'].split(',') if pk.strip().isdigit()])
+
+        renderer = BulkDocumentRenderer(options['document'], orders, processes=options['processes'],
+                                        chunk_size=options['chunk_size'])
+        if options['output'].endswith('.zip'):
+            with io.open(options['output'], 'wb') as fileobj:
+                count = renderer.write_zip(fileobj)
+        else:
+            count = 0
+            with io.open(options['output'], 'w', encoding='utf-8') as fileobj:
+                for content in renderer.iter_html():
+                    fileobj.write(content)
+                    count += 1
+        self.stdout.write("Rendered {} documents into {}.".format(count, options['output']))
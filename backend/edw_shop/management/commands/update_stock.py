@@ -0,0 +1,25 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.core.management.base import BaseCommand
+
+from edw_shop.exchange.stock import StockUpdater, iter_rows
+
+
+class Command(BaseCommand):
+    help = "Update the quantity in stock and the price of products from a CSV or JSON Lines feed."
+
+    def add_arguments(self, parser):
+        parser.add_argument('file',
+                            help="CSV file with a header line, or JSON Lines file if the name ends with .jsonl.")
+        parser.add_argument('--key', choices=StockUpdater.keys, default='sid',
+                            help="Column identifying the products.")
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        updater = StockUpdater(key=options['key'], batch_size=options['batch_size'])
+        stats = updater.update(iter_rows(options['file']))
+        for error in updater.errors:
+            self.stderr.write("Row {index}: {errors}".format(**error))
+        if options['verbosity'] > 0:
+            self.stdout.write(', '.join('{} {}'.format(v, k) for k, v in stats.items()))
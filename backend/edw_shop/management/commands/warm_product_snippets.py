@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.core.management.base import BaseCommand
+
+from edw_shop.models.product import ProductModel
+from edw_shop.snippets import SnippetWarmer
+
+
+class Command(BaseCommand):
+    help = "Pre-render the cached HTML snippets of all active products."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--postfix', action='append', default=[],
+                            help="Postfix of the snippet templates, may be repeated. Defaults to media.")
+        parser.add_argument('--language', action='append', default=[],
+                            help="Language to render the snippets in, may be repeated. "
+                                 "Defaults to settings.LANGUAGE_CODE.")
+        parser.add_argument('--label', default='catalog')
+        parser.add_argument('--base-uri', default='http://localhost',
+                            help="Absolute base URI used for the media in the snippets.")
+        parser.add_argument('--processes', type=int, default=1,
+                            help="Number of worker processes.")
+        parser.add_argument('--chunk-size', type=int, default=200)
+
+    def handle(self, *args, **options):
+        product_ids = ProductModel.objects.active().order_by('pk').values_list('pk', flat=True)
+        warmer = SnippetWarmer(product_ids, postfixes=options['postfix'] or ('media',),
+                               languages=options['language'], label=options['label'], base_uri=options['base_uri'],
+                               processes=options['processes'], chunk_size=options['chunk_size'])
+        total = 0
+        for count in warmer:
+            total += count
+            if options['verbosity'] > 1:
+                self.stdout.write("Warmed up {} of {} products.".format(total, len(warmer.product_ids)))
+        self.stdout.write("Warmed up the snippets of {} products.".format(total))
@@ -7,11 +7,11 @@ Source: https://github.com/awesto/django-shop/blob/b4d16fc0927cf2b7eea13a38f4a91
 from six import with_metaclass
 
 from django.db import models
-from django.template.loader import select_template
 from django.utils.translation import ugettext_lazy as _
 
 from edw import deferred
 from edw_shop.conf import app_settings
+from edw_shop.rendering import template_registry
 
 
 class AddressManager(models.Manager):
@@ -50,9 +50,8 @@ class BaseAddress(models.Model):
             '{}/address.txt'.format(app_settings.APP_LABEL),
             'shop/address.txt',
         ]
-        template = select_template(template_names)
-        context = {'address': self}
-        return template.render(context)
+        key = (app_settings.APP_LABEL, None, '{}-address'.format(self.address_type))
+        return template_registry.render(key, template_names, {'address': self})
     as_text.short_description = _("Address")
 
 
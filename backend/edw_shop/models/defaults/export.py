@@ -0,0 +1,8 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from edw_shop.models.export import BaseExportCheckpoint
+
+
+class ExportCheckpoint(BaseExportCheckpoint):
+    """Default materialized model for ExportCheckpoint"""
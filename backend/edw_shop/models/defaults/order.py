@@ -68,6 +68,13 @@ class Order(BaseOrder):
     def entity_name(self):
         return self.get_name()
 
+    def get_search_texts(self):
+        texts = super(Order, self).get_search_texts()
+        if self.number is None:
+            texts.pop(0)  # no number assigned yet
+        texts.extend([self.shipping_address_text, self.billing_address_text])
+        return texts
+
     @classmethod
     def resolve_number(cls, number):
         bits = number.split('-')
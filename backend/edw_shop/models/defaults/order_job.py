@@ -0,0 +1,8 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from edw_shop.models.job import BaseOrderJob
+
+
+class OrderJob(BaseOrderJob):
+    """Default materialized model for OrderJob"""
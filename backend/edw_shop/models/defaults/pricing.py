@@ -0,0 +1,12 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from edw_shop.models.pricing import BasePriceList, BasePriceListItem
+
+
+class PriceList(BasePriceList):
+    """Default materialized model for PriceList"""
+
+
+class PriceListItem(BasePriceListItem):
+    """Default materialized model for PriceListItem"""
@@ -2,7 +2,8 @@
 from __future__ import unicode_literals
 
 from django.db import models
-from django.core.urlresolvers import reverse
+from django.db.models import Q
+from django.db.models.signals import post_save, post_delete
 from django.utils.encoding import python_2_unicode_compatible
 from django.utils.translation import ugettext_lazy as _
 from django.utils.functional import cached_property
@@ -13,15 +14,17 @@ from edw.models.term import TermModel
 from edw import deferred
 
 from edw_shop.conf import app_settings
-from edw_shop.models.product import BaseProduct
-from edw_shop.models.utils import get_or_create_term_wrapper, _default_system_flags_restriction
+from edw_shop.detail_urls import product_detail_urls
+from edw_shop.models.pricing import price_index
+from edw_shop.models.product import BaseProduct, ProductModel, touch_products
+from edw_shop.models.terms import GroupTermResolver, system_terms
+from edw_shop.models.utils import bulk_update_fields
 from edw_shop.money.fields import MoneyField
 
 from edw_shop.rest.validators.product import ProductValidator
 from edw_shop.rest.serializers.product import ProductUnitSerializer, ProductGroupPropertySerializer
 
 from edw_fluent.models.page_layout import (
-    get_views_layouts,
     get_layout_slug_by_model_name,
     get_or_create_view_layouts_root
 )
@@ -137,15 +140,15 @@ class Product(BaseProduct):
                 'source': 'get_detail_url',
                 'read_only': True
             }),
-            'gallery': ('edw.rest.serializers.related.entity_image.EntityImageSerializer', {
+            'gallery': ('edw_shop.rest.serializers.product.ProductImageSerializer', {
                 'read_only': True,
                 'many': True
             }),
-            'thumbnail': ('edw.rest.serializers.related.entity_image.EntityImageSerializer', {
+            'thumbnail': ('edw_shop.rest.serializers.product.ProductImageSerializer', {
                 'read_only': True,
                 'many': True
             }),
-            'attachments': ('edw.rest.serializers.related.entity_file.EntityFileSerializer', {
+            'attachments': ('edw_shop.rest.serializers.product.ProductFileSerializer', {
                 'read_only': True,
                 'many': True
             }),
@@ -188,68 +191,24 @@ class Product(BaseProduct):
             html_content = validated_data.pop('html_content', None)
             # экстра единицы измерения
             units = validated_data.pop("extra_units", None)
-            if units is not None:
-                for unit in units:
-                    instance.units.update_or_create(uuid=unit.get("uuid"),
-                                                    defaults={"value": unit.get("value", 1.0),
-                                                              "name": unit.get("name"),
-                                                              "discount": unit.get("discount", 0.0)})
-            else:
-                instance.units.all().delete()
+            # при частичном обновлении без единиц измерения оставляем их как есть
+            if units is not None or not (is_created or self.partial):
+                self.units_changes = ProductUnit.objects.sync(instance, units or [])
             # создаем копии групповых свойств по категориям
             #producer
 
             group_props = validated_data.pop("group_props", None)
 
-            if group_props is not None:
-                for group_prop in group_props:
-                    group_prop_name = group_prop['name']
-                    group_prop_guid = group_prop['guid']
-                    parent_group_prop_name = group_prop['parent_name']
-                    parent_group_prop_guid = group_prop['parent_guid']
-                    categories = group_prop['categories']
-                    default_root_term_slug = group_prop['default_root']
-
-                    if not categories:
-                        categories = [default_root_term_slug]
-
-                    for category in categories:
-                        category_term = TermModel.objects.active().get(slug=category)
-                        if category_term:
-                            root_category = get_or_create_term_wrapper(category_term)
-
-                            # Получаем термин папки производитель
-                            group_root_tag, created = root_category.get_children().get_or_create(
-                                slug=parent_group_prop_guid,
-                                defaults={
-                                    "parent_id": root_category.id,
-                                    "name": parent_group_prop_name,
-                                    "semantic_rule": TermModel.OR_RULE,
-                                    "attributes": TermModel.attributes.is_characteristic,
-                                    "specification_mode": TermModel.SPECIFICATION_MODES[1][0],
-                                    "system_flags": _default_system_flags_restriction
-                                })
-
-                            # Получаем термин производителя
-                            product_group_term, created = group_root_tag.get_children().get_or_create(
-                                slug=group_prop_guid,
-                                defaults={
-                                    "parent_id": group_root_tag.id,
-                                    "name": group_prop_name,
-                                    "semantic_rule": TermModel.OR_RULE,
-                                    "system_flags": _default_system_flags_restriction
-                                })
-
-                            if not created and product_group_term.name != group_prop_name:
-                                product_group_term.name = group_prop_name
-                                product_group_term.save()
-
-                            # устанавливаем в товар
-                            instance.terms.add(product_group_term)
-                            # усли update добавляем в active_terms_ids
-                            if validated_data.get('active_terms_ids', None) is not None and \
-                                product_group_term.id not in validated_data['active_terms_ids']:
-                                validated_data['active_terms_ids'].append(product_group_term.id)
+            if group_props:
+                resolver = GroupTermResolver.for_serializer(self)
+                product_group_terms = resolver.resolve(group_props)
+                # устанавливаем в товар
+                instance.terms.add(*product_group_terms)
+                # усли update добавляем в active_terms_ids
+                if validated_data.get('active_terms_ids', None) is not None:
+                    for product_group_term in product_group_terms:
+                        if product_group_term.id not in validated_data['active_terms_ids']:
+                            validated_data['active_terms_ids'].append(product_group_term.id)
 
 
         def create(self, validated_data):
@@ -344,18 +303,15 @@ class Product(BaseProduct):
     def get_estimated_delivery(self):
         return self.estimated_delivery if self.estimated_delivery else ""
 
-    def get_price(self, request):
-        return self.unit_price
-
 
     def get_detail_url(self, data_mart=None):
         if data_mart is None:
             data_mart = self.data_mart
         if data_mart:
             page = data_mart.get_cached_detail_page()
-            return reverse('product_detail', args=[page.url.strip('/'), self.pk] if page is not None else [self.pk])
-        else:
-            return reverse('product_detail', args=[self.pk])
+            if page is not None:
+                return product_detail_urls.get_url(self.pk, page.url.strip('/'))
+        return product_detail_urls.get_url(self.pk)
 
     @cached_property
     def breadcrumbs(self):
@@ -387,7 +343,7 @@ class Product(BaseProduct):
         return extra
 
     def get_price(self, request):
-        return self.unit_price
+        return price_index.get_price(self, request)
 
     @cached_property
     def gallery(self):
@@ -401,7 +357,8 @@ class Product(BaseProduct):
         return list(self.get_thumbnail())
 
     def get_thumbnail(self):
-        return EntityImage.objects.filter(entity=self, key=EntityImage.THUMBNAIL_KEY).order_by('order')
+        return EntityImage.objects.filter(entity=self, key=EntityImage.THUMBNAIL_KEY).select_related(
+            'image').order_by('order')
 
     @cached_property
     def attachments(self):
@@ -412,8 +369,7 @@ class Product(BaseProduct):
 
     @cached_property
     def thumbnails(self):
-        thumbnails = [x.image for x in
-                      EntityImage.objects.filter(entity=self, key=EntityImage.THUMBNAIL_KEY).order_by('order')]
+        thumbnails = [x.image for x in self.thumbnail]
         if thumbnails:
             return thumbnails
         else:
@@ -423,6 +379,33 @@ class Product(BaseProduct):
             else:
                 return self.ordered_images[:1]
 
+    @classmethod
+    def prefetch_media(cls, products):
+        """
+        Fill the cached properties `gallery`, `thumbnail`, `attachments` and, if possible,
+        `thumbnails` of all `products` with two queries, rather than with up to four queries
+        per product. Returns the list of products.
+        """
+        products = list(products)
+        product_ids = [product.pk for product in products if product.pk is not None]
+        if not product_ids:
+            return products
+        images, files = {}, {}
+        for image in EntityImage.objects.filter(
+                Q(key__isnull=True) | Q(key=EntityImage.THUMBNAIL_KEY),
+                entity_id__in=product_ids).select_related('image').order_by('order'):
+            images.setdefault((image.entity_id, image.key), []).append(image)
+        for entity_file in EntityFile.objects.filter(entity_id__in=product_ids, key__isnull=True).order_by('order'):
+            files.setdefault(entity_file.entity_id, []).append(entity_file)
+        for product in products:
+            gallery = product.__dict__['gallery'] = images.get((product.pk, None), [])
+            thumbnail = product.__dict__['thumbnail'] = images.get((product.pk, EntityImage.THUMBNAIL_KEY), [])
+            product.__dict__['attachments'] = files.get(product.pk, [])
+            thumbnails = [x.image for x in thumbnail] or [x.image for x in gallery][:1]
+            if thumbnails:
+                product.__dict__['thumbnails'] = thumbnails
+        return products
+
 
     @classmethod
     def validate_term_model(cls):
@@ -470,10 +453,15 @@ class Product(BaseProduct):
 
         super(Product, cls).validate_term_model()
 
+    @classmethod
+    def get_in_stock_choice(cls, in_stock):
+        return cls.IN_STOCK_CHOICES_TERMS[0] if in_stock and in_stock > 0 else cls.IN_STOCK_CHOICES_TERMS[1]
+
     def need_terms_validation_after_save(self, origin, **kwargs):
         do_validate_layout = kwargs["context"]["validate_view_layout"] = True
 
-        if origin is None or origin.in_stock != self.in_stock:
+        # re-tag only if the product moves between in stock and out of stock
+        if origin is None or self.get_in_stock_choice(origin.in_stock) != self.get_in_stock_choice(self.in_stock):
             kwargs["context"]["validate_in_stock"] = True
 
         return super(Product, self).need_terms_validation_after_save(
@@ -485,7 +473,7 @@ class Product(BaseProduct):
         force_validate_terms = context.get("force_validate_terms", False)
 
         if force_validate_terms or context.get("validate_view_layout", False):
-            views_layouts = get_views_layouts()
+            views_layouts = system_terms.get_views_layouts()
             to_remove = [v for k, v in views_layouts.items() if k != Product.LAYOUT_TERM_SLUG]
             self.terms.remove(*to_remove)
             to_add = views_layouts.get(Product.LAYOUT_TERM_SLUG, None)
@@ -494,23 +482,9 @@ class Product(BaseProduct):
 
         if force_validate_terms or context.get("validate_in_stock", False):
 
-            current_stock_choice = Product.IN_STOCK_CHOICES_TERMS[0] if self.in_stock and self.in_stock > 0 else Product.IN_STOCK_CHOICES_TERMS[1]
+            current_stock_choice = self.get_in_stock_choice(self.in_stock)
 
-            in_stock_root_choices = getattr(Product, '_in_stock_root_choices', None)
-            if in_stock_root_choices is None:
-                in_stock_root_choices = {}
-                try:
-                    parent_wraper = get_or_create_model_class_wrapper_term(Product)
-                    root = TermModel.objects.get(
-                            slug=self.IN_STOCK_ROOT_TERM[0],
-                            parent=parent_wraper
-                        )
-                    for term in root.get_descendants(include_self=True):
-                        in_stock_root_choices[term.slug] = term
-                except TermModel.DoesNotExist:
-                    pass
-
-                    setattr(Product, '_in_stock_root_choices', in_stock_root_choices)
+            in_stock_root_choices = system_terms.get_in_stock_choices(Product)
 
             to_remove = [v for k, v in in_stock_root_choices.items() if k != current_stock_choice[0]]
             self.terms.remove(*to_remove)
@@ -521,6 +495,64 @@ class Product(BaseProduct):
         super(Product, self).validate_terms(origin, **kwargs)
 
 
+class ProductUnitManager(models.Manager):
+
+    fields = ('name', 'value', 'discount')
+
+    def clean_unit(self, unit):
+        return {
+            'uuid': unit['uuid'],
+            'name': unit.get('name') or '',
+            'value': Decimal(unit.get('value', 1)),
+            'discount': Decimal(unit.get('discount') or 0),
+        }
+
+    def sync_many(self, units):
+        """
+        Synchronize the additional units of many products with the dictionary `units`, which maps
+        a product id to the list of its units. The units are matched by `uuid`: the existing units
+        are loaded with one query, then the missing units are inserted with one INSERT, the modified
+        units are updated with one UPDATE and the units absent in the list are removed with one
+        DELETE. Nothing is written if nothing has changed.
+        Returns the dictionary ``{'created': [...], 'updated': [...], 'deleted': [...]}`` of units.
+        """
+        changes = {'created': [], 'updated': [], 'deleted': []}
+        if not units:
+            return changes
+        existing = dict(((unit.product_id, unit.uuid), unit)
+                        for unit in self.filter(product_id__in=list(units.keys())))
+        seen = set()
+        for product_id, product_units in units.items():
+            for unit_data in product_units:
+                unit_data = self.clean_unit(unit_data)
+                key = (product_id, unit_data['uuid'])
+                if key in seen:
+                    continue
+                seen.add(key)
+                unit = existing.get(key)
+                if unit is None:
+                    changes['created'].append(self.model(product_id=product_id, **unit_data))
+                elif any(getattr(unit, field) != unit_data[field] for field in self.fields):
+                    for field in self.fields:
+                        setattr(unit, field, unit_data[field])
+                    changes['updated'].append(unit)
+        changes['deleted'] = [unit for key, unit in existing.items() if key not in seen]
+        if changes['deleted']:
+            self.filter(pk__in=[unit.pk for unit in changes['deleted']]).delete()
+        if changes['created']:
+            self.bulk_create(changes['created'])
+        bulk_update_fields(self.model, changes['updated'], self.fields)
+        # bulk writes send no signals
+        touch_products(unit.product_id for kind in changes.values() for unit in kind)
+        return changes
+
+    def sync(self, product, units):
+        """
+        Synchronize the additional units of `product` with the list `units`, see `sync_many`.
+        """
+        return self.sync_many({product.pk: units})
+
+
 @python_2_unicode_compatible
 class ProductUnit(models.Model):
     product = models.ForeignKey(
@@ -536,8 +568,24 @@ class ProductUnit(models.Model):
     uuid = models.CharField(verbose_name=_('measurment unit code'), max_length=50, null=False, blank=False)
     discount = models.DecimalField(verbose_name=_('discount'), default=0, max_digits=10, decimal_places=3)
 
+    objects = ProductUnitManager()
+
     class Meta:
         app_label = app_settings.APP_LABEL
         verbose_name = _("Unit")
         verbose_name_plural = _("Units")
         unique_together = ("product", "uuid")
+
+
+def touch_product_of_related(sender, instance, **kwargs):
+    # the units, images and files of a product are part of its cached representations
+    if sender is ProductUnit:
+        touch_products([instance.product_id])
+    else:
+        # images and files belong to any kind of entity, only those of products are touched
+        touch_products(ProductModel.objects.filter(pk=instance.entity_id).values_list('pk', flat=True))
+
+
+for related_model in (ProductUnit, EntityImage, EntityFile):
+    post_save.connect(touch_product_of_related, sender=related_model, dispatch_uid='edw_shop_touch_product_of_related')
+    post_delete.connect(touch_product_of_related, sender=related_model, dispatch_uid='edw_shop_touch_product_of_related')
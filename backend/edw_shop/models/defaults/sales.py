@@ -0,0 +1,12 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from edw_shop.models.sales import BaseDailySales, BaseProductSales
+
+
+class DailySales(BaseDailySales):
+    """Default materialized model for DailySales"""
+
+
+class ProductSales(BaseProductSales):
+    """Default materialized model for ProductSales"""
@@ -6,13 +6,15 @@ from __future__ import unicode_literals
 
 from six import with_metaclass
 
-from django.db import models
+from django.db import models, transaction
+from django.db.models import Count, F, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
 from django.core.exceptions import ImproperlyConfigured
 from django.utils.encoding import python_2_unicode_compatible
 from django.utils.translation import ugettext_lazy as _
 
 from edw import deferred
-from edw_shop.models.order import BaseOrder, BaseOrderItem, OrderItemModel
+from edw_shop.models.order import BaseOrder, BaseOrderItem, OrderModel, OrderItemModel
 
 
 @python_2_unicode_compatible
@@ -56,6 +58,13 @@ class BaseDelivery(with_metaclass(deferred.ForeignKeyBuilder, models.Model)):
     def __str__(self):
         return _("Delivery ID: {}").format(self.id)
 
+    def delete(self, *args, **kwargs):
+        # delete the items one by one, so that they can roll back the delivered quantities
+        with transaction.atomic():
+            for delivery_item in DeliveryItemModel.objects.filter(delivery=self):
+                delivery_item.delete()
+            return super(BaseDelivery, self).delete(*args, **kwargs)
+
     @classmethod
     def perform_model_checks(cls):
         canceled_field = [f for f in OrderItemModel._meta.fields if f.attname == 'canceled']
@@ -68,6 +77,32 @@ class BaseDelivery(with_metaclass(deferred.ForeignKeyBuilder, models.Model)):
 DeliveryModel = deferred.MaterializedModel(BaseDelivery)
 
 
+class DeliveryItemManager(models.Manager):
+    """
+    Sums up the delivered quantities with grouped queries, rather than aggregating per order item.
+    """
+    def delivered_quantities(self, items):
+        """
+        Returns a dictionary mapping the primary keys of the given order items onto the
+        quantity delivered so far. Order items without any delivery are missing in this map.
+        """
+        return dict(self.get_queryset().filter(item__in=items).order_by().values('item').annotate(
+            delivered=Sum('quantity')).values_list('item', 'delivered'))
+
+    def annotate_deliveries(self, queryset):
+        """
+        Annotate a queryset of deliveries with the summed up quantity and the number of their items.
+        """
+        quantity_field = self.model._meta.get_field('quantity')
+        items = self.get_queryset().filter(delivery=OuterRef('pk')).order_by().values('delivery')
+        return queryset.annotate(
+            delivered_quantity=Coalesce(Subquery(items.annotate(total=Sum('quantity')).values('total'),
+                                                 output_field=quantity_field), 0, output_field=quantity_field),
+            delivered_count=Coalesce(Subquery(items.annotate(total=Count('pk')).values('total'),
+                                              output_field=models.IntegerField()), 0),
+        )
+
+
 class BaseDeliveryItem(with_metaclass(deferred.ForeignKeyBuilder, models.Model)):
     """
     Abstract base class to keep track on the delivered quantity for each ordered item. Since the
@@ -84,6 +119,8 @@ class BaseDeliveryItem(with_metaclass(deferred.ForeignKeyBuilder, models.Model))
         verbose_name=_("Ordered item"),
     )
 
+    objects = DeliveryItemManager()
+
     class Meta:
         abstract = True
         verbose_name = _("Deliver item")
@@ -101,5 +138,34 @@ class BaseDeliveryItem(with_metaclass(deferred.ForeignKeyBuilder, models.Model))
             msg = "Class `{}` must implement a field named `quantity`."
             raise ImproperlyConfigured(msg.format(cls.__name__))
 
+    def save(self, *args, **kwargs):
+        with transaction.atomic():
+            previous = None
+            if self.pk is not None:
+                previous = type(self).objects.filter(pk=self.pk).values_list('quantity', flat=True).first()
+            super(BaseDeliveryItem, self).save(*args, **kwargs)
+            self.update_delivered_counters(self.quantity - (previous or 0))
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            result = super(BaseDeliveryItem, self).delete(*args, **kwargs)
+            self.update_delivered_counters(-self.quantity)
+        return result
+
+    def update_delivered_counters(self, delta):
+        """
+        Add `delta` to the delivered quantity of the ordered item and subtract it from the unfulfilled
+        quantity of its order, unless that item has been canceled. Bulk operations bypassing this
+        method must be followed by ``manage.py check_delivery_counters --repair``.
+        """
+        if not delta:
+            return
+        OrderItemModel.objects.filter(pk=self.item_id).update(delivered_quantity=F('delivered_quantity') + delta)
+        # both conditions must apply to the same item, hence they are passed to one filter call
+        lookups = {'items__pk': self.item_id}
+        if any(f.attname == 'canceled' for f in OrderItemModel._meta.fields):
+            lookups['items__canceled'] = False
+        OrderModel.objects.filter(**lookups).update(unfulfilled_quantity=F('unfulfilled_quantity') - delta)
+
 
 DeliveryItemModel = deferred.MaterializedModel(BaseDeliveryItem)
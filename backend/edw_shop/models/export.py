@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from six import with_metaclass
+
+from django.db import models
+from django.utils.encoding import python_2_unicode_compatible
+from django.utils.translation import ugettext_lazy as _
+
+from edw import deferred
+
+
+@python_2_unicode_compatible
+class BaseExportCheckpoint(with_metaclass(deferred.ForeignKeyBuilder, models.Model)):
+    """
+    Remembers up to which order an incremental export has been delivered, so that the next run
+    only exports orders updated afterwards.
+    """
+    name = models.CharField(
+        _("Name"),
+        max_length=100,
+        unique=True,
+    )
+
+    last_updated_at = models.DateTimeField(
+        _("Last updated at"),
+        null=True,
+        blank=True,
+        help_text=_("Modification timestamp of the last exported object."),
+    )
+
+    last_pk = models.PositiveIntegerField(
+        _("Last primary key"),
+        null=True,
+        blank=True,
+        help_text=_("Primary key of the last exported object."),
+    )
+
+    exported_at = models.DateTimeField(
+        _("Exported at"),
+        auto_now=True,
+    )
+
+    class Meta:
+        abstract = True
+        verbose_name = _("Export checkpoint")
+        verbose_name_plural = _("Export checkpoints")
+
+    def __str__(self):
+        return self.name
+
+
+ExportCheckpointModel = deferred.MaterializedModel(BaseExportCheckpoint)
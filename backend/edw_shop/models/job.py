@@ -0,0 +1,224 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import traceback
+from collections import OrderedDict
+from datetime import timedelta
+from six import with_metaclass
+
+from django.db import connection, models, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from django.utils.encoding import python_2_unicode_compatible
+from django.utils.module_loading import import_string
+from django.utils.translation import ugettext_lazy as _
+
+from edw import deferred
+
+from edw_shop.conf import app_settings
+from edw_shop.models.fields import JSONField
+from edw_shop.models.order import BaseOrder
+
+
+class OrderJobManager(models.Manager):
+    """
+    Durable queue of post purchase jobs. Jobs are written in the same transaction as the order they
+    belong to, so that a committed order always has its secondary work scheduled.
+    """
+    def enqueue(self, order, handler, payload=None, max_attempts=None, delay=0):
+        """
+        Schedule the callable referred by the dotted path `handler` to be invoked for `order`.
+        """
+        return self.create(
+            order=order,
+            handler=handler,
+            payload=payload or {},
+            max_attempts=max_attempts or app_settings.ORDER_JOB_MAX_ATTEMPTS,
+            available_at=timezone.now() + timedelta(seconds=delay),
+        )
+
+    def claim(self, limit, worker=''):
+        """
+        Lock and return up to `limit` due jobs. Jobs left in state ``running`` by a crashed worker
+        become visible again after `SHOP_ORDER_JOB_VISIBILITY_TIMEOUT` seconds, hence each job is
+        processed at least once. Stale jobs which used up their `max_attempts` are marked as failed,
+        so that a job crashing its worker is not handed out forever.
+        """
+        now = timezone.now()
+        stale = now - timedelta(seconds=app_settings.ORDER_JOB_VISIBILITY_TIMEOUT)
+        lock_kwargs = {}
+        if connection.features.has_select_for_update_skip_locked:
+            lock_kwargs['skip_locked'] = True
+        with transaction.atomic():
+            self.get_queryset().filter(status=self.model.RUNNING, locked_at__lt=stale,
+                                       attempts__gte=F('max_attempts')).update(
+                status=self.model.FAILED, locked_at=None,
+                last_error="The worker did not report back and all attempts are used up.")
+            queryset = self.get_queryset().select_for_update(**lock_kwargs).filter(
+                Q(status=self.model.PENDING, available_at__lte=now) |
+                Q(status=self.model.RUNNING, locked_at__lt=stale, attempts__lt=F('max_attempts'))
+            ).order_by('available_at', 'pk')
+            job_ids = list(queryset.values_list('pk', flat=True)[:limit])
+            if job_ids:
+                self.get_queryset().filter(pk__in=job_ids).update(
+                    status=self.model.RUNNING, locked_at=now, locked_by=worker[:100],
+                    attempts=F('attempts') + 1)
+        return list(self.get_queryset().filter(pk__in=job_ids).select_related('order').order_by('pk'))
+
+
+@python_2_unicode_compatible
+class BaseOrderJob(with_metaclass(deferred.ForeignKeyBuilder, models.Model)):
+    """
+    A unit of secondary work, such as populating dialog forms, rendering notifications or
+    updating statistics, executed after the purchase request has been answered.
+    """
+    PENDING, RUNNING, DONE, FAILED = 'pending', 'running', 'done', 'failed'
+
+    STATUSES = (
+        (PENDING, _("Pending")),
+        (RUNNING, _("Running")),
+        (DONE, _("Done")),
+        (FAILED, _("Failed")),
+    )
+
+    order = deferred.ForeignKey(
+        BaseOrder,
+        related_name='jobs',
+        verbose_name=_("Order"),
+    )
+
+    handler = models.CharField(
+        _("Handler"),
+        max_length=255,
+        help_text=_("Dotted path to the callable processing this job."),
+    )
+
+    payload = JSONField(
+        verbose_name=_("Payload"),
+        blank=True,
+    )
+
+    status = models.CharField(
+        _("Status"),
+        max_length=10,
+        choices=STATUSES,
+        default=PENDING,
+        db_index=True,
+    )
+
+    attempts = models.PositiveSmallIntegerField(
+        _("Attempts"),
+        default=0,
+    )
+
+    max_attempts = models.PositiveSmallIntegerField(
+        _("Max attempts"),
+        default=5,
+    )
+
+    available_at = models.DateTimeField(
+        _("Available at"),
+        default=timezone.now,
+        db_index=True,
+    )
+
+    locked_at = models.DateTimeField(
+        _("Locked at"),
+        null=True,
+        blank=True,
+    )
+
+    locked_by = models.CharField(
+        _("Locked by"),
+        max_length=100,
+        blank=True,
+        default='',
+    )
+
+    last_error = models.TextField(
+        _("Last error"),
+        blank=True,
+        default='',
+    )
+
+    created_at = models.DateTimeField(
+        _("Created at"),
+        auto_now_add=True,
+    )
+
+    updated_at = models.DateTimeField(
+        _("Updated at"),
+        auto_now=True,
+    )
+
+    objects = OrderJobManager()
+
+    class Meta:
+        abstract = True
+        verbose_name = _("Order job")
+        verbose_name_plural = _("Order jobs")
+
+    def __str__(self):
+        return "{} ({})".format(self.handler, self.status)
+
+    @classmethod
+    def get_cart_snapshot(cls, cart):
+        """
+        Returns the foreign keys of `cart`, such as its addresses, which are not stored on the order
+        but are required to restore the cart for the handlers.
+        """
+        return dict((field.attname, getattr(cart, field.attname)) for field in cart._meta.concrete_fields
+                    if field.is_relation and field.name != 'customer')
+
+    def restore_cart(self, order, snapshot=None):
+        """
+        Returns an unsaved cart as it was on the moment of purchase, with the foreign keys from
+        `snapshot` and the extra data, subtotal, total and extra rows stored on the order.
+        """
+        from edw_shop.models.cart import CartModel
+        from edw_shop.serializers.cart import ExtraCartRow
+
+        extra = dict(order.extra or {})
+        rows = extra.pop('rows', None) or []
+        cart = CartModel(customer=order.customer, extra=extra, **(snapshot or {}))
+        cart.subtotal, cart.total = order.subtotal, order.total
+        cart.extra_rows = OrderedDict((modifier, ExtraCartRow(data)) for modifier, data in rows)
+        # its items have been moved into the order, hence the cart must not be updated again
+        cart._dirty = False
+        return cart
+
+    def execute(self):
+        """
+        Invoke the handler with the order, an emulated request and the restored cart, as they
+        were on the moment of purchase.
+        """
+        from edw_shop.models.order import OrderModel
+
+        order = self.order
+        request = OrderModel.objects.restore_request(order)
+        payload = dict(self.payload or {})
+        cart = self.restore_cart(order, payload.pop('cart', None))
+        import_string(self.handler)(order, cart, request, **payload)
+
+    def succeed(self):
+        self.status = self.DONE
+        self.locked_at = None
+        self.last_error = ''
+        self.save(update_fields=['status', 'locked_at', 'last_error', 'updated_at'])
+
+    def fail(self, exc_info=None):
+        """
+        Reschedule the job using an exponential backoff, or give up after `max_attempts`.
+        """
+        self.last_error = ''.join(traceback.format_exception(*exc_info)) if exc_info else ''
+        self.locked_at = None
+        if self.attempts >= self.max_attempts:
+            self.status = self.FAILED
+        else:
+            self.status = self.PENDING
+            delay = app_settings.ORDER_JOB_RETRY_DELAY * 2 ** max(self.attempts - 1, 0)
+            self.available_at = timezone.now() + timedelta(seconds=delay)
+        self.save(update_fields=['status', 'locked_at', 'last_error', 'available_at', 'updated_at'])
+
+
+OrderJobModel = deferred.MaterializedModel(BaseOrderJob)
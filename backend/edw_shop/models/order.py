@@ -4,6 +4,7 @@ Source: https://github.com/awesto/django-shop/blob/7378f024b0982ba5bf48fd07ffb18
 """
 from __future__ import unicode_literals
 
+import copy
 from six import with_metaclass
 from decimal import Decimal
 
@@ -15,6 +16,7 @@ try:
     from django.urls import NoReverseMatch
 except ImportError:
     from django.core.urlresolvers import NoReverseMatch
+from django.utils import timezone
 from django.utils.encoding import python_2_unicode_compatible
 from django.utils.functional import cached_property
 from django.utils.translation import ugettext_lazy as _, pgettext_lazy, get_language_from_request
@@ -28,6 +30,7 @@ from django_fsm import FSMField, transition
 from ipware.ip import get_ip
 
 from edw import deferred
+from edw.models.customer import CustomerModel
 from edw.models.entity import EntityModel, BaseEntityManager
 from edw.models.mixins.entity.fsm import FSMMixin
 from edw.models.data_mart import DataMartModel
@@ -38,6 +41,7 @@ from edw_shop.conf import app_settings
 from edw_shop.models.cart import CartItemModel
 from edw_shop.models.fields import JSONField
 from edw_shop.money.fields import MoneyField, MoneyMaker
+from edw_shop.rendering import emulate_request
 from .product import BaseProduct, ProductModel
 
 from sid.rest.serializers.relation import ObjRelationSerializer
@@ -94,6 +98,8 @@ class OrderManager(BaseEntityManager):
         order = self.model(customer=cart.customer, _subtotal=Decimal(0), _total=Decimal(0), stored_request=self.stored_request(request))
         order.get_or_assign_number()
         order.save()
+        # remember the order, so that the purchase view can find it regardless of the payment provider
+        request._created_order = order
         return order
 
     def stored_request(self, request):
@@ -108,6 +114,113 @@ class OrderManager(BaseEntityManager):
             'user_agent': request.META.get('HTTP_USER_AGENT'),
         }
 
+    def restore_request(self, order):
+        """
+        Emulate a Django request from the information stored on the moment of purchase. It is used
+        to process an order offline, for instance by the post purchase job workers.
+        """
+        stored_request = order.stored_request or {}
+        request = emulate_request(stored_request.get('absolute_base_uri'), stored_request.get('language'),
+                                  HTTP_USER_AGENT=stored_request.get('user_agent') or '',
+                                  REMOTE_ADDR=stored_request.get('remote_ip') or '127.0.0.1')
+        request.customer = order.customer
+        request.user = order.customer.user
+        return request
+
+    def bulk_transition(self, orders, transition_name, user=None):
+        """
+        Move many orders through the transition named `transition_name` at once.
+        `orders` may be a queryset or a list of primary keys. The source states of all orders are
+        validated with one query and the transition methods are invoked in memory, sending the usual
+        django-fsm signals, inside a single transaction. Transitions marked with ``bulk=True`` in their
+        `custom` dictionary only change the status; their new states are written with one UPDATE per
+        target state, instead of saving each order entity, hence `search_document` and the post_save
+        receivers are not updated for them. Orders moved through any other transition are saved one
+        by one, as they are by a single transition.
+
+        Returns a list of per order results: dicts with keys `id`, `number`, `source`, `target`
+        and `error`. Afterwards the signal `edw_shop.signals.orders_transitioned` is sent once.
+        """
+        from edw_shop.signals import orders_transitioned
+
+        graph = self.model.get_transition_graph()
+        if not any(t.name == transition_name for t in graph.transitions):
+            raise ValueError("Order model has no transition named '{}'.".format(transition_name))
+
+        if isinstance(orders, models.QuerySet):
+            # re-select by primary key: a filtered changelist queryset may carry DISTINCT or outer
+            # joins, which can not be locked with FOR UPDATE
+            orders = orders.order_by().values_list('pk', flat=True)
+        queryset = self.get_queryset().filter(pk__in=list(orders))
+
+        results, targets = [], {}
+        with transaction.atomic():
+            transitioned = []
+            orders = list(queryset.select_for_update().order_by('pk'))
+            graph.prefetch_amount_paid(orders)
+            for order in orders:
+                result = {'id': order.pk, 'number': order.get_number(), 'source': order.status,
+                          'target': None, 'error': None}
+                results.append(result)
+                transition = next((t for t in graph.get_transitions(order.status) if t.name == transition_name), None)
+                if transition is None:
+                    result['error'] = force_text(_("Transition is not allowed from this state."))
+                    continue
+                if not graph.check_conditions(order, transition):
+                    result['error'] = force_text(_("Transition conditions are not met."))
+                    continue
+                if user is not None and not transition.has_perm(order, user):
+                    result['error'] = force_text(_("Permission denied."))
+                    continue
+                origin = copy.copy(order)
+                try:
+                    with transaction.atomic():
+                        getattr(order, transition_name)()
+                except Exception as exc:
+                    result['error'] = force_text(exc)
+                    continue
+                result['target'] = order.status
+                if transition.custom.get('bulk'):
+                    targets.setdefault(order.status, []).append(order.pk)
+                    transitioned.append((origin, order))
+                else:
+                    # the transition may have changed any field
+                    order.save()
+
+            now = timezone.now()
+            for target, pks in targets.items():
+                self.get_queryset().filter(pk__in=pks).update(status=target, updated_at=now)
+
+            # keep the state terms in sync, as `EntityModel.save` would do
+            for origin, order in transitioned:
+                context = {}
+                if order.need_terms_validation_after_save(origin, context=context):
+                    order.validate_terms(origin, context=context)
+
+            if app_settings.SALES_ROLLUPS:
+                from edw_shop.models.sales import update_sales_rollups
+
+                update_sales_rollups([(order, origin.status, order.status) for origin, order in transitioned])
+            for origin, order in transitioned:
+                order._saved_status = order.status
+
+        orders_transitioned.send(sender=self.model, transition=transition_name, results=results, user=user)
+        return results
+
+    def get_available_transitions(self, orders, user=None):
+        """
+        Returns a mapping of order primary keys to the names of their currently applicable
+        transitions, with the payments of all orders being summed up in one query.
+        """
+        return self.model.get_transition_graph().get_available_transitions_for(orders, user)
+
+    def with_open_lines(self):
+        """
+        Returns the orders having items, which have not been delivered completely. Orders created
+        before the counters existed are only found after ``manage.py check_delivery_counters --repair``.
+        """
+        return self.get_queryset().filter(unfulfilled_quantity__gt=0)
+
     #todo: delete
     def filter_from_request(self, request):
 
@@ -220,6 +333,44 @@ class BaseOrder(FSMMixin, EntityModel.materialized):
         help_text=_("Parts of the Request objects on the moment of purchase."),
     )
 
+    purchase_key = models.CharField(
+        _("Purchase key"),
+        max_length=64,
+        null=True,
+        blank=True,
+        editable=False,
+        db_index=True,
+        help_text=_("Idempotency key of the purchase request which created this order."),
+    )
+
+    purchase_response = JSONField(
+        verbose_name=_("Purchase response"),
+        help_text=_("Response returned to the purchase request which created this order."),
+        blank=True,
+        null=True,
+        editable=False,
+    )
+
+    unfulfilled_quantity = models.DecimalField(
+        _("Unfulfilled quantity"),
+        default=0,
+        max_digits=30,
+        decimal_places=3,
+        db_index=True,
+        editable=False,
+        help_text=_("Ordered quantity of all items not canceled, which has not been delivered yet. Orders "
+                    "created before this counter existed must be populated once with "
+                    "`manage.py check_delivery_counters --repair`."),
+    )
+
+    search_document = models.TextField(
+        _("Search document"),
+        blank=True,
+        default='',
+        editable=False,
+        help_text=_("Lowercased text of all searchable attributes, maintained on save."),
+    )
+
     objects = OrderManager()
 
     class Meta:
@@ -227,6 +378,12 @@ class BaseOrder(FSMMixin, EntityModel.materialized):
         verbose_name = pgettext_lazy('order_models', "Order")
         verbose_name_plural = pgettext_lazy('order_models', "Orders")
 
+    def __init__(self, *args, **kwargs):
+        super(BaseOrder, self).__init__(*args, **kwargs)
+        # the status as persisted, used to update the sales rollups on status changes; read from
+        # the instance dictionary, so that a deferred status is not loaded for every instance
+        self._saved_status = self.__dict__.get('status') if self.pk else None
+
     def __str__(self):
         return self.get_number()
 
@@ -238,7 +395,8 @@ class BaseOrder(FSMMixin, EntityModel.materialized):
 
         #validators = []
 
-        exclude = ['_subtotal', '_total', 'stored_request', 'images', 'files', 'status'] # todo: 'status readonly
+        exclude = ['_subtotal', '_total', 'stored_request', 'purchase_key', 'purchase_response', 'search_document',
+                   'images', 'files', 'status'] # todo: 'status readonly
 
         include = {
             'transition': ('rest_framework.serializers.CharField', {
@@ -309,63 +467,63 @@ class BaseOrder(FSMMixin, EntityModel.materialized):
 
     @transition(
         field=status, source='new', target='processed',
-        custom=dict(admin=True, button_name=_("New to processed"))
+        custom=dict(admin=True, button_name=_("New to processed"), bulk=True)
     )
     def new_to_processed(self):
         pass
 
     @transition(
         field=status, source='new', target='in_work',
-        custom=dict(admin=True, button_name=_("New to in work"))
+        custom=dict(admin=True, button_name=_("New to in work"), bulk=True)
     )
     def new_to_in_work(self):
         pass
 
     @transition(
         field=status, source='new', target='shipped',
-        custom=dict(admin=True, button_name=_("New to shipped"))
+        custom=dict(admin=True, button_name=_("New to shipped"), bulk=True)
     )
     def new_to_shipped(self):
         pass
 
     @transition(
         field=status, source='new', target='completed',
-        custom=dict(admin=True, button_name=_("New to completed"))
+        custom=dict(admin=True, button_name=_("New to completed"), bulk=True)
     )
     def new_to_completed(self):
         pass
 
     @transition(
         field=status, source='new', target='canceled',
-        custom=dict(admin=True, button_name=_("New to canceled"))
+        custom=dict(admin=True, button_name=_("New to canceled"), bulk=True)
     )
     def new_to_canceled(self):
         pass
 
     @transition(
         field=status, source='processed', target='canceled',
-        custom=dict(admin=True, button_name=_("Processed to canceled"))
+        custom=dict(admin=True, button_name=_("Processed to canceled"), bulk=True)
     )
     def processed_to_canceled(self):
         pass
 
     @transition(
         field=status, source='processed', target='in_work',
-        custom=dict(admin=True, button_name=_("Processed to in_work"))
+        custom=dict(admin=True, button_name=_("Processed to in_work"), bulk=True)
     )
     def processed_to_in_work(self):
         pass
 
     @transition(
         field=status, source='processed', target='shipped',
-        custom=dict(admin=True, button_name=_("Processed to in_work"))
+        custom=dict(admin=True, button_name=_("Processed to in_work"), bulk=True)
     )
     def processed_to_shipped(self):
         pass
 
     @transition(
         field=status, source='processed', target='completed',
-        custom=dict(admin=True, button_name=_("Processed to completed"))
+        custom=dict(admin=True, button_name=_("Processed to completed"), bulk=True)
     )
     def processed_to_completed(self):
         pass
@@ -373,42 +531,42 @@ class BaseOrder(FSMMixin, EntityModel.materialized):
 
     @transition(
         field=status, source='in_work', target='shipped',
-        custom=dict(admin=True, button_name=_("In work to shipped"))
+        custom=dict(admin=True, button_name=_("In work to shipped"), bulk=True)
     )
     def in_work_to_shipped(self):
         pass
 
     @transition(
         field=status, source='in_work', target='completed',
-        custom=dict(admin=True, button_name=_("In work to completed"))
+        custom=dict(admin=True, button_name=_("In work to completed"), bulk=True)
     )
     def in_work_to_completed(self):
         pass
 
     @transition(
         field=status, source='in_work', target='canceled',
-        custom=dict(admin=True, button_name=_("In work to canceled"))
+        custom=dict(admin=True, button_name=_("In work to canceled"), bulk=True)
     )
     def in_work_to_canceled(self):
         pass
 
     @transition(
         field=status, source='shipped', target='completed',
-        custom=dict(admin=True, button_name=_("Shipped to completed"))
+        custom=dict(admin=True, button_name=_("Shipped to completed"), bulk=True)
     )
     def shipped_to_completed(self):
         pass
 
     @transition(
         field=status, source='shipped', target='canceled',
-        custom=dict(admin=True, button_name=_("Shipped to canceled"))
+        custom=dict(admin=True, button_name=_("Shipped to canceled"), bulk=True)
     )
     def shipped_to_canceled(self):
         pass
 
     @transition(
         field=status, source='canceled', target='new',
-        custom=dict(admin=True, button_name=_("Canceled to new"))
+        custom=dict(admin=True, button_name=_("Canceled to new"), bulk=True)
     )
     def canceled_to_new(self):
         pass
@@ -476,6 +634,23 @@ class BaseOrder(FSMMixin, EntityModel.materialized):
         """
         return str(self.pk)
 
+    def get_search_texts(self):
+        """
+        Hook returning the texts an order shall be found by in the admin backend. A class
+        inheriting from Order may extend them with its own fields.
+        """
+        texts = [self.get_number()]
+        customer = self.customer if self.customer_id else None
+        if customer is not None:
+            user = getattr(customer, 'user', None)
+            if user is not None:
+                texts.extend([user.email, user.last_name])
+            texts.append(getattr(customer, 'number', None))
+        return texts
+
+    def get_search_document(self):
+        return ' '.join(force_text(text) for text in self.get_search_texts() if text).lower()
+
     @classmethod
     def resolve_number(cls, number):
         """
@@ -532,6 +707,7 @@ class BaseOrder(FSMMixin, EntityModel.materialized):
         Override this method, in case a customized cart has some fields which have to be transfered
         to the cart.
         """
+        unfulfilled_quantity = 0
         for cart_item in cart.items.active():
             cart_item.update(request)
             order_item = OrderItemModel(order=self)
@@ -539,35 +715,107 @@ class BaseOrder(FSMMixin, EntityModel.materialized):
                 order_item.populate_from_cart_item(cart_item, request)
                 order_item.save()
                 cart_item.delete()
+                unfulfilled_quantity += order_item.quantity
             except CartItemModel.DoesNotExist:
                 pass
 
+        self.unfulfilled_quantity = unfulfilled_quantity
+
         self._subtotal = Decimal(cart.subtotal)
         self._total = Decimal(cart.total)
         self.extra = dict(cart.extra)
         self.extra.update(rows=[(modifier, extra_row.data) for modifier, extra_row in cart.extra_rows.items()])
         self.save()
 
-        self.populate_dialog_forms(cart, request)
+        self.run_post_purchase_jobs(cart, request)
+
+    def compute_unfulfilled_quantity(self):
+        """
+        Sum up the ordered quantity, which has not been delivered yet, from the counters of the
+        order items. Canceled items are skipped, if the order item model can be canceled.
+        """
+        items = self.items.all()
+        if any(f.attname == 'canceled' for f in OrderItemModel._meta.fields):
+            items = items.filter(canceled=False)
+        return sum((quantity - delivered for quantity, delivered in items.values_list(
+            'quantity', 'delivered_quantity')), Decimal(0))
+
+    def update_unfulfilled_quantity(self):
+        """
+        Recompute the counter `unfulfilled_quantity`, for instance after items have been canceled.
+        """
+        self.unfulfilled_quantity = self.compute_unfulfilled_quantity()
+        type(self).objects.filter(pk=self.pk).update(unfulfilled_quantity=self.unfulfilled_quantity)
+
+    def run_post_purchase_jobs(self, cart, request):
+        """
+        Invoke the handlers from `SHOP_POST_PURCHASE_JOBS`, followed by the update of the sales
+        rollups if `SHOP_SALES_ROLLUPS` is set. If `SHOP_POST_PURCHASE_ASYNC` is set, they are written
+        to the order job queue instead, inside the transaction committing this order, so that the
+        purchase request only has to wait for the order itself.
+        """
+        handlers = list(app_settings.POST_PURCHASE_JOBS)
+        if app_settings.SALES_ROLLUPS:
+            handlers.append('edw_shop.jobs.handlers.update_sales_rollups')
+        payload = {'status': self.status}
+        if app_settings.POST_PURCHASE_ASYNC:
+            from edw_shop.models.job import OrderJobModel
+
+            payload.update(cart=OrderJobModel.get_cart_snapshot(cart))
+            for handler in handlers:
+                OrderJobModel.objects.enqueue(self, handler, payload=payload)
+        else:
+            for handler in handlers:
+                import_string(handler)(self, cart, request, **payload)
 
 
     @transaction.atomic
     def readd_to_cart(self, cart):
         """
         Re-add the items of this order back to the cart.
+        The order items and the cart items for their products are loaded once and merged in memory,
+        new cart items are created and existing ones are updated in bulk. Products, which disable
+        `merge_cart_items_by_product`, are merged one by one through their `is_in_cart`.
         """
-        for order_item in self.items.all():
+        from edw_shop.models.utils import bulk_update_fields
+
+        order_items = list(self.items.select_related('product').order_by('pk'))
+        cart_items = {}
+        for cart_item in CartItemModel.objects.filter(
+                cart=cart, product__in=set(item.product_id for item in order_items)).order_by('pk'):
+            cart_items.setdefault(cart_item.product_id, cart_item)
+
+        created, updated = [], {}
+        for order_item in order_items:
             extra = dict(order_item.extra)
             extra.pop('rows', None)
             extra.update(product_code=order_item.product_code)
-            cart_item = order_item.product.is_in_cart(cart, **extra)
+            product = order_item.product
+            if not product.merge_cart_items_by_product:
+                cart_item = product.is_in_cart(cart, **extra)
+                if cart_item:
+                    cart_item.quantity = max(cart_item.quantity, order_item.quantity)
+                else:
+                    cart_item = CartItemModel(cart=cart, product=product, product_code=order_item.product_code,
+                                              quantity=order_item.quantity, extra=extra)
+                cart_item.save()
+                continue
+            cart_item = cart_items.get(product.pk)
             if cart_item:
-                cart_item.quantity = max(cart_item.quantity, order_item.quantity)
+                if order_item.quantity > cart_item.quantity:
+                    cart_item.quantity = order_item.quantity
+                    if cart_item.pk:
+                        updated[cart_item.pk] = cart_item
             else:
-                cart_item = CartItemModel(cart=cart, product=order_item.product,
-                                          product_code=order_item.product_code,
-                                          quantity=order_item.quantity, extra=extra)
-            cart_item.save()
+                cart_item = cart_items[product.pk] = CartItemModel(
+                    cart=cart, product=product, product_code=order_item.product_code,
+                    quantity=order_item.quantity, extra=extra)
+                created.append(cart_item)
+
+        CartItemModel.objects.bulk_create(created)
+        bulk_update_fields(CartItemModel, updated.values(), ['quantity'])
+        cart._cached_cart_items = None
+        cart._dirty = True
 
     def save(self, **kwargs):
         """
@@ -576,7 +824,17 @@ class BaseOrder(FSMMixin, EntityModel.materialized):
         # round the total to the given decimal_places
         self._subtotal = BaseOrder.round_amount(self._subtotal)
         self._total = BaseOrder.round_amount(self._total)
-        super(BaseOrder, self).save(**kwargs)
+        if app_settings.ORDER_SEARCH_DOCUMENT:
+            self.search_document = self.get_search_document()
+        saved_status = self._saved_status
+        self.__dict__.pop('_transition_conditions', None)
+        with transaction.atomic():
+            super(BaseOrder, self).save(**kwargs)
+            if app_settings.SALES_ROLLUPS and saved_status is not None and saved_status != self.status:
+                from edw_shop.models.sales import update_sales_rollups
+
+                update_sales_rollups([(self, saved_status, self.status)])
+        self._saved_status = self.status
 
     @cached_property
     def amount_paid(self):
@@ -624,7 +882,22 @@ class BaseOrder(FSMMixin, EntityModel.materialized):
         """
         Returns a generator over all transition objects for this Order model.
         """
-        return cls.status.field.get_all_transitions(OrderModel)
+        return iter(cls.get_transition_graph().transitions)
+
+    @classmethod
+    def get_transition_graph(cls):
+        """
+        Returns the transition graph compiled for the materialized Order model.
+        """
+        from edw_shop.models.workflow import TransitionGraph
+
+        return TransitionGraph.for_model(OrderModel)
+
+    def get_available_transitions(self, user=None):
+        """
+        Returns the transitions applicable on this order in its current state.
+        """
+        return self.get_transition_graph().get_available_transitions(self, user)
 
     @classmethod
     def get_transition_name(cls, target):
@@ -679,6 +952,14 @@ class OrderPayment(with_metaclass(deferred.ForeignKeyBuilder, models.Model)):
     def __str__(self):
         return _("Payment ID: {}").format(self.id)
 
+    def save(self, *args, **kwargs):
+        super(OrderPayment, self).save(*args, **kwargs)
+        # the paid amount and the conditions depending on it are stale on the order paid
+        order = getattr(self, self._meta.get_field('order').get_cache_name(), None)
+        if order is not None:
+            order.__dict__.pop('amount_paid', None)
+            order.__dict__.pop('_transition_conditions', None)
+
 
 @python_2_unicode_compatible
 class BaseOrderItem(with_metaclass(deferred.ForeignKeyBuilder, models.Model)):
@@ -731,6 +1012,17 @@ class BaseOrderItem(with_metaclass(deferred.ForeignKeyBuilder, models.Model)):
         **BaseOrder.decimalfield_kwargs
     )
 
+    delivered_quantity = models.DecimalField(
+        _("Delivered quantity"),
+        default=0,
+        max_digits=30,
+        decimal_places=3,
+        editable=False,
+        help_text=_("Quantity delivered so far, maintained by the delivery items. Items created before "
+                    "this counter existed must be populated once with "
+                    "`manage.py check_delivery_counters --repair`."),
+    )
+
     extra = JSONField(
         verbose_name=_("Extra fields"),
         help_text=_("Arbitrary information for this order item"),
@@ -802,3 +1094,29 @@ class BaseOrderItem(with_metaclass(deferred.ForeignKeyBuilder, models.Model)):
 
 
 OrderItemModel = deferred.MaterializedModel(BaseOrderItem)
+
+
+def refresh_order_search_documents(sender, instance, **kwargs):
+    """
+    Rebuild the search documents of the orders of a customer, after the customer or its user has
+    been saved, since they contain the customer's number, email and last name.
+    """
+    if not app_settings.ORDER_SEARCH_DOCUMENT:
+        return
+    update_fields = kwargs.get('update_fields')
+    if isinstance(instance, CustomerModel):
+        orders = OrderModel.objects.filter(customer=instance)
+    else:
+        # a user saved for another reason, such as its last login
+        if update_fields is not None and not set(update_fields) & {'email', 'last_name'}:
+            return
+        orders = OrderModel.objects.filter(customer__user=instance)
+    from edw_shop.models.utils import bulk_update_fields
+
+    changed = []
+    for order in orders.select_related('customer__user'):
+        search_document = order.get_search_document()
+        if order.search_document != search_document:
+            order.search_document = search_document
+            changed.append(order)
+    bulk_update_fields(OrderModel, changed, ['search_document'])
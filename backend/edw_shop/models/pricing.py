@@ -0,0 +1,263 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import threading
+import uuid
+from datetime import timedelta
+
+from six import with_metaclass
+
+from django.core.cache import cache
+from django.db import models, transaction
+from django.utils import timezone
+from django.utils.encoding import python_2_unicode_compatible
+from django.utils.translation import ugettext_lazy as _
+
+from edw import deferred
+
+from edw_shop.conf import app_settings
+from edw_shop.models.product import BaseProduct
+from edw_shop.money.fields import MoneyField
+
+
+@python_2_unicode_compatible
+class BasePriceList(with_metaclass(deferred.ForeignKeyBuilder, models.Model)):
+    """
+    A list of special prices for the customers belonging to one of its `groups`, or for all
+    customers if it has no groups. Of all valid price lists applicable to a customer, the one with
+    the highest `priority` containing the product determines its price.
+    """
+    name = models.CharField(
+        _("Name"),
+        max_length=255,
+    )
+
+    groups = models.ManyToManyField(
+        'auth.Group',
+        verbose_name=_("Customer groups"),
+        blank=True,
+        help_text=_("Groups of the customers this price list applies to, all customers if empty."),
+    )
+
+    priority = models.IntegerField(
+        _("Priority"),
+        default=0,
+        help_text=_("Price lists with a higher priority take precedence."),
+    )
+
+    valid_from = models.DateTimeField(
+        _("Valid from"),
+        null=True,
+        blank=True,
+    )
+
+    valid_until = models.DateTimeField(
+        _("Valid until"),
+        null=True,
+        blank=True,
+    )
+
+    active = models.BooleanField(
+        _("Active"),
+        default=True,
+    )
+
+    updated_at = models.DateTimeField(
+        _("Updated at"),
+        auto_now=True,
+        db_index=True,
+    )
+
+    class Meta:
+        abstract = True
+        verbose_name = _("Price list")
+        verbose_name_plural = _("Price lists")
+
+    def __str__(self):
+        return self.name
+
+
+PriceListModel = deferred.MaterializedModel(BasePriceList)
+
+
+@python_2_unicode_compatible
+class BasePriceListItem(with_metaclass(deferred.ForeignKeyBuilder, models.Model)):
+    """
+    The price of a product in a price list.
+    """
+    price_list = deferred.ForeignKey(
+        BasePriceList,
+        verbose_name=_("Price list"),
+        related_name='items',
+    )
+
+    product = deferred.ForeignKey(
+        BaseProduct,
+        verbose_name=_("Product"),
+    )
+
+    unit_price = MoneyField(
+        _("Unit price"),
+        decimal_places=3,
+    )
+
+    updated_at = models.DateTimeField(
+        _("Updated at"),
+        auto_now=True,
+        db_index=True,
+    )
+
+    class Meta:
+        abstract = True
+        verbose_name = _("Price list item")
+        verbose_name_plural = _("Price list items")
+        unique_together = ('price_list', 'product')
+
+    def __str__(self):
+        return "{}: {}".format(self.price_list_id, self.unit_price)
+
+
+PriceListItemModel = deferred.MaterializedModel(BasePriceListItem)
+
+
+class PriceIndex(object):
+    """
+    Per process index of all price lists and their prices, used by ``Product.get_price(request)``
+    if ``SHOP_PRICE_LISTS`` is set.
+    The index is loaded on first use. Once a transaction saving a price list or an item commits,
+    a new version is stored in the Django cache; on their next lookup, all processes then load the
+    price lists and items updated since their last refresh. Deleting price lists or items, or
+    changing their groups, forces a full reload. A (re)load builds new dictionaries, which replace
+    the current ones at once, so that concurrent lookups never see a partially loaded index.
+    The prices resolved for a request are memoized on the request.
+    """
+    version_key = 'edw_shop:price_index:version'
+    reset_key = 'edw_shop:price_index:reset'
+    # overlap of incremental refreshes, covering transactions committed late
+    refresh_overlap = timedelta(minutes=1)
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # (price list id -> (priority, valid from, valid until, group ids),
+        #  product id -> {price list id: price})
+        self._index = ({}, {})
+        self._version = self._reset = self._refreshed_at = None
+
+    def check_version(self):
+        version, reset = cache.get(self.version_key), cache.get(self.reset_key)
+        if self._refreshed_at is not None and version == self._version and reset == self._reset:
+            return
+        with self._lock:
+            if self._refreshed_at is None or reset != self._reset:
+                self.load()
+            else:
+                self.load(since=self._refreshed_at - self.refresh_overlap)
+            self._version, self._reset = version, reset
+
+    def load(self, since=None):
+        refreshed_at = timezone.now()
+        price_lists = PriceListModel.objects.prefetch_related('groups')
+        items = PriceListItemModel.objects.all()
+        if since is None:
+            lists, prices = {}, {}
+        else:
+            price_lists = price_lists.filter(updated_at__gte=since)
+            items = items.filter(updated_at__gte=since)
+            lists, prices = dict(self._index[0]), dict(self._index[1])
+        for price_list in price_lists:
+            if price_list.active:
+                lists[price_list.pk] = (
+                    price_list.priority, price_list.valid_from, price_list.valid_until,
+                    frozenset(group.pk for group in price_list.groups.all()))
+            else:
+                lists.pop(price_list.pk, None)
+        copied = set()
+        for price_list_id, product_id, unit_price in items.values_list('price_list_id', 'product_id', 'unit_price'):
+            if product_id not in copied:
+                # never modify the dictionaries read by concurrent lookups
+                prices[product_id] = dict(prices.get(product_id, {}))
+                copied.add(product_id)
+            prices[product_id][price_list_id] = unit_price
+        self._index = (lists, prices)
+        self._refreshed_at = refreshed_at
+
+    @staticmethod
+    def get_group_ids(request):
+        customer = getattr(request, 'customer', None)
+        user = getattr(customer, 'user', None) or getattr(request, 'user', None)
+        if user is None or not user.is_authenticated():
+            return frozenset()
+        return frozenset(user.groups.values_list('pk', flat=True))
+
+    def get_price_list_ids(self, request):
+        """
+        Returns the ids of the price lists applicable for the customer of `request`, ordered
+        by priority.
+        """
+        try:
+            return request._price_list_ids
+        except AttributeError:
+            pass
+        self.check_version()
+        group_ids, now = self.get_group_ids(request), timezone.now()
+        lists = self._index[0]
+        applicable = [
+            (priority, pk) for pk, (priority, valid_from, valid_until, list_group_ids) in lists.items()
+            if (valid_from is None or valid_from <= now) and (valid_until is None or now < valid_until)
+            and (not list_group_ids or list_group_ids & group_ids)
+        ]
+        request._price_list_ids = tuple(pk for priority, pk in sorted(applicable, key=lambda x: (-x[0], x[1])))
+        return request._price_list_ids
+
+    def get_cache_component(self, request):
+        """
+        Returns a string distinguishing the price lists applicable for `request`, to be part of
+        the keys of cached representations showing prices.
+        """
+        if not app_settings.PRICE_LISTS or request is None:
+            return ''
+        return '{}@{}'.format('.'.join(str(pk) for pk in self.get_price_list_ids(request)), self._version)
+
+    def get_prices(self, products, request):
+        """
+        Returns a dictionary mapping the primary keys of `products` onto their price for the
+        customer of `request`, falling back to the unit price of the product.
+        """
+        if not app_settings.PRICE_LISTS or request is None:
+            return dict((product.pk, product.unit_price) for product in products)
+        memo = request.__dict__.setdefault('_product_prices', {})
+        missing = [product for product in products if product.pk not in memo]
+        if missing:
+            price_list_ids = self.get_price_list_ids(request)
+            product_prices = self._index[1]
+            for product in missing:
+                prices = product_prices.get(product.pk, {})
+                price = next((prices[pk] for pk in price_list_ids if pk in prices), None)
+                memo[product.pk] = product.unit_price if price is None else price
+        return dict((product.pk, memo[product.pk]) for product in products)
+
+    def get_price(self, product, request):
+        return self.get_prices([product], request)[product.pk]
+
+    def invalidate(self, full=False):
+        """
+        Store a new version, once the current transaction commits. Otherwise other processes could
+        reload the index before the changes are visible and keep the stale prices under the new version.
+        """
+        def bump_version():
+            if full:
+                cache.set(self.reset_key, uuid.uuid4().hex, None)
+            cache.set(self.version_key, uuid.uuid4().hex, None)
+        transaction.on_commit(bump_version)
+
+
+price_index = PriceIndex()
+
+
+def invalidate_price_index(sender, instance, **kwargs):
+    price_index.invalidate(full=kwargs.get('signal') is models.signals.post_delete)
+
+
+def invalidate_price_list_groups(sender, instance, model, action, **kwargs):
+    if action.startswith('post_'):
+        price_index.invalidate(full=True)
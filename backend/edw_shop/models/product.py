@@ -9,6 +9,7 @@ from datetime import datetime
 #import operator
 #from django.db import models
 #from django.utils import six
+from django.utils import timezone
 from django.utils.encoding import force_text
 #from django.utils.six.moves.urllib.parse import urljoin
 from django.utils.translation import ugettext_lazy as _
@@ -17,6 +18,9 @@ from django.utils.translation import ugettext_lazy as _
 from edw import deferred
 from edw.models.entity import EntityModel
 
+from edw_shop.models.terms import system_terms
+from edw_shop.models.utils import bulk_set_m2m
+
 
 # class BaseProductManager(PolymorphicManager):
     # """
@@ -89,6 +93,11 @@ class BaseProduct(EntityModel.materialized):
     a field ``product_code = models.CharField(_("Product code"), max_length=255, unique=True)``
     to the class implementing the product.
     """
+    # Products of the same kind share one cart item, as done by the default `is_in_cart`. A class
+    # overriding `is_in_cart` to tell variants apart shall set this to ``False``, so that
+    # `readd_to_cart` asks each product for its cart item instead of merging them by product.
+    merge_cart_items_by_product = True
+
     # created_at = models.DateTimeField(
         # _("Created at"),
         # auto_now_add=True,
@@ -124,6 +133,15 @@ class BaseProduct(EntityModel.materialized):
         """
         return self.polymorphic_ctype.model
 
+    def get_revision(self):
+        """
+        Returns the revision of the product, used to version cached representations. The revision
+        changes whenever the product is saved or touched, see `touch_products`.
+        """
+        if self.updated_at is None:
+            return '0'
+        return self.updated_at.strftime('%Y%m%d%H%M%S%f')
+
     # def get_absolute_url(self):
     #     """
     #     Hook for returning the canonical Django URL of this product.
@@ -188,3 +206,37 @@ class BaseProduct(EntityModel.materialized):
 
 
 ProductModel = deferred.MaterializedModel(BaseProduct)
+
+
+def touch_products(product_ids):
+    """
+    Bump the revision of the products with primary keys `product_ids` with one UPDATE, for instance
+    after changing their units, images or files.
+    """
+    product_ids = set(product_ids)
+    if product_ids:
+        ProductModel.objects.filter(pk__in=list(product_ids)).update(updated_at=timezone.now())
+
+
+def get_in_stock_terms(model=ProductModel):
+    """
+    Returns a dictionary mapping the slugs of the in stock choices onto the primary keys of their terms.
+    """
+    return dict((slug, term.id) for slug, term in system_terms.get_in_stock_choices(model).items()
+                if slug != model.IN_STOCK_ROOT_TERM[0])
+
+
+def update_in_stock_terms(products, model=ProductModel, in_stock_terms=None):
+    """
+    Tag the given products with the in stock choice matching their quantity in stock, using a
+    constant number of queries. This is the batched equivalent of ``Product.validate_terms`` with
+    the context flag ``validate_in_stock``.
+    """
+    in_stock_terms = get_in_stock_terms(model) if in_stock_terms is None else in_stock_terms
+    if not in_stock_terms:
+        return
+    links = {}
+    for product in products:
+        term_id = in_stock_terms.get(model.get_in_stock_choice(product.in_stock)[0])
+        links[product.pk] = {term_id} if term_id else set()
+    bulk_set_m2m(model, 'terms', links, scope=in_stock_terms.values())
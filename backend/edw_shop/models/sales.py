@@ -0,0 +1,180 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from collections import defaultdict
+from decimal import Decimal
+from six import with_metaclass
+
+from django.db import IntegrityError, models, transaction
+from django.db.models import F, Sum
+from django.utils import timezone
+from django.utils.translation import ugettext_lazy as _
+
+from edw import deferred
+
+from edw_shop.models.order import BaseOrder
+from edw_shop.models.product import BaseProduct
+
+
+class SalesRollupManager(models.Manager):
+    """
+    Model manager applying deltas onto the rollup rows and answering the dashboard queries.
+    """
+    def add(self, keys, orders, quantity, revenue):
+        """
+        Add the given deltas to the row identified by `keys`, creating it if missing.
+        """
+        updates = {
+            'orders': F('orders') + orders,
+            'quantity': F('quantity') + quantity,
+            'revenue': F('revenue') + revenue,
+        }
+        if self.get_queryset().filter(**keys).update(**updates):
+            return
+        try:
+            with transaction.atomic():
+                self.create(orders=orders, quantity=quantity, revenue=revenue, **keys)
+        except IntegrityError:
+            # created by a concurrent transaction in the meantime
+            self.get_queryset().filter(**keys).update(**updates)
+
+    def summary(self, start=None, end=None, statuses=None, group_by=('day',)):
+        """
+        Returns the summed up orders, quantity and revenue in the given range of days, grouped by
+        the fields in `group_by`, for instance ``('day', 'status')`` or ``('product',)``.
+        """
+        queryset = self.get_queryset()
+        if start is not None:
+            queryset = queryset.filter(day__gte=start)
+        if end is not None:
+            queryset = queryset.filter(day__lte=end)
+        if statuses is not None:
+            queryset = queryset.filter(status__in=statuses)
+        return queryset.values(*group_by).annotate(
+            orders=Sum('orders'), quantity=Sum('quantity'), revenue=Sum('revenue')).order_by(*group_by)
+
+
+class BaseSalesRollup(models.Model):
+    day = models.DateField(
+        _("Day"),
+    )
+
+    status = models.CharField(
+        _("Status"),
+        max_length=50,
+    )
+
+    orders = models.IntegerField(
+        _("Orders"),
+        default=0,
+    )
+
+    quantity = models.DecimalField(
+        _("Quantity"),
+        default=0,
+        max_digits=30,
+        decimal_places=3,
+    )
+
+    revenue = models.DecimalField(
+        _("Revenue"),
+        default=0,
+        **BaseOrder.decimalfield_kwargs
+    )
+
+    objects = SalesRollupManager()
+
+    class Meta:
+        abstract = True
+
+
+class BaseDailySales(with_metaclass(deferred.ForeignKeyBuilder, BaseSalesRollup)):
+    """
+    Sold quantity and revenue per day and order status.
+    """
+    class Meta:
+        abstract = True
+        unique_together = ('day', 'status')
+        verbose_name = _("Daily sales")
+        verbose_name_plural = _("Daily sales")
+
+
+DailySalesModel = deferred.MaterializedModel(BaseDailySales)
+
+
+class BaseProductSales(with_metaclass(deferred.ForeignKeyBuilder, BaseSalesRollup)):
+    """
+    Sold quantity and revenue per day, product and order status.
+    """
+    product = deferred.ForeignKey(
+        BaseProduct,
+        null=True,
+        blank=True,
+        db_constraint=False,
+        on_delete=models.DO_NOTHING,
+        related_name='+',
+        verbose_name=_("Product"),
+    )
+
+    class Meta:
+        abstract = True
+        unique_together = ('day', 'status', 'product')
+        verbose_name = _("Product sales")
+        verbose_name_plural = _("Product sales")
+
+
+ProductSalesModel = deferred.MaterializedModel(BaseProductSales)
+
+
+def get_sales_day(order):
+    created_at = order.created_at or timezone.now()
+    if timezone.is_aware(created_at):
+        created_at = timezone.localtime(created_at)
+    return created_at.date()
+
+
+def update_sales_rollups(changes):
+    """
+    Apply the contribution of orders onto the sales rollups. `changes` is a list of triples
+    ``(order, old_status, new_status)``: the order's items are subtracted from the rollups of
+    `old_status` and added to those of `new_status`, where ``None`` stands for no status, ie.
+    an order being added to or removed from the statistics.
+    The items of all given orders are summed up with one grouped query.
+    """
+    changes = [(order, old, new) for order, old, new in changes if old != new]
+    if not changes:
+        return
+    from edw_shop.models.order import OrderItemModel
+
+    contributions = defaultdict(list)
+    rows = OrderItemModel.objects.filter(order__in=[order.pk for order, old, new in changes]).values(
+        'order_id', 'product_id').annotate(quantity=Sum('quantity'), revenue=Sum('_line_total'))
+    for row in rows:
+        contributions[row['order_id']].append(row)
+
+    daily, products = defaultdict(lambda: [0, Decimal(0), Decimal(0)]), defaultdict(lambda: [0, Decimal(0), Decimal(0)])
+    for order, old_status, new_status in changes:
+        items = contributions.get(order.pk)
+        if not items:
+            continue
+        day = get_sales_day(order)
+        for status, sign in ((old_status, -1), (new_status, 1)):
+            if status is None:
+                continue
+            totals = daily[(day, status)]
+            totals[0] += sign
+            for item in items:
+                quantity, revenue = Decimal(item['quantity'] or 0), item['revenue'] or Decimal(0)
+                totals[1] += sign * quantity
+                totals[2] += sign * revenue
+                product_totals = products[(day, status, item['product_id'])]
+                product_totals[0] += sign
+                product_totals[1] += sign * quantity
+                product_totals[2] += sign * revenue
+
+    with transaction.atomic():
+        for (day, status), (orders, quantity, revenue) in daily.items():
+            DailySalesModel.objects.add({'day': day, 'status': status}, orders, quantity, revenue)
+        for (day, status, product_id), (orders, quantity, revenue) in products.items():
+            ProductSalesModel.objects.add({'day': day, 'status': status, 'product_id': product_id},
+                                          orders, quantity, revenue)
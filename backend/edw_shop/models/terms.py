@@ -0,0 +1,204 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import threading
+import uuid
+
+from django.core.cache import cache
+from django.db import transaction
+
+from edw.models.mixins.entity import get_or_create_model_class_wrapper_term
+from edw.models.term import TermModel
+from edw_fluent.models.page_layout import get_views_layouts
+
+from edw_shop.models.utils import (
+    ENTITY_CLASS_WRAPPER_TERM_SLUG_PATTERN,
+    get_or_create_term_wrapper,
+    _default_system_flags_restriction,
+)
+
+
+class GroupTermResolver(object):
+    """
+    Resolves the terms of the product group properties (for instance the producer), which are
+    organized as ``category wrapper -> group property folder -> group property``.
+    All terms are memoized, so that a resolver shared across a request or a batch of products looks
+    up each category, folder and group only once. Lookups missing in the memo are done with one
+    query per level for all group properties passed to `prefetch`.
+    Missing terms are created one by one, since the term tree does not permit bulk inserts.
+    """
+    def __init__(self):
+        self._categories = {}  # category slug -> term
+        self._wrappers = {}  # category term id -> wrapper term
+        self._children = {}  # (parent id, slug) -> term
+
+    @classmethod
+    def for_serializer(cls, serializer):
+        """
+        Returns the resolver shared through the context of the (root) serializer. If the serializer
+        is the child of a list serializer, the group properties of all items are prefetched at once.
+        """
+        context = serializer.context
+        resolver = context.get('group_term_resolver')
+        if resolver is None:
+            resolver = context['group_term_resolver'] = cls()
+            parent = getattr(serializer, 'parent', None)
+            items = getattr(parent, '_validated_data', None)
+            if isinstance(items, list):
+                group_props = []
+                for item in items:
+                    group_props.extend(item.get('group_props') or [])
+                resolver.prefetch(group_props)
+        return resolver
+
+    @staticmethod
+    def get_categories(group_prop):
+        return group_prop['categories'] or [group_prop['default_root']]
+
+    def prefetch(self, group_props):
+        slugs = set()
+        for group_prop in group_props:
+            slugs.update(self.get_categories(group_prop))
+        slugs.difference_update(self._categories.keys())
+        if slugs:
+            found = {}
+            for term in TermModel.objects.active().filter(slug__in=slugs).select_related('parent'):
+                found.setdefault(term.slug, []).append(term)
+            # ambiguous slugs are left to ``get_category``, which raises the proper exception
+            self._categories.update((slug, terms[0]) for slug, terms in found.items() if len(terms) == 1)
+        wrappers = [self.get_wrapper(self._categories[slug]) for slug in self._categories]
+        folders = self._prefetch_children([w.id for w in wrappers],
+                                          set(group_prop['parent_guid'] for group_prop in group_props))
+        self._prefetch_children([f.id for f in folders], set(group_prop['guid'] for group_prop in group_props))
+
+    def _prefetch_children(self, parent_ids, slugs):
+        missing = [parent_id for parent_id in parent_ids
+                   if any((parent_id, slug) not in self._children for slug in slugs)]
+        if missing and slugs:
+            for term in TermModel.objects.filter(parent_id__in=missing, slug__in=slugs):
+                self._children.setdefault((term.parent_id, term.slug), term)
+        return [term for (parent_id, slug), term in self._children.items() if parent_id in parent_ids]
+
+    def get_category(self, slug):
+        try:
+            return self._categories[slug]
+        except KeyError:
+            term = self._categories[slug] = TermModel.objects.active().get(slug=slug)
+            return term
+
+    def get_wrapper(self, category_term):
+        try:
+            return self._wrappers[category_term.id]
+        except KeyError:
+            pass
+        parent = category_term.parent
+        if parent is not None and parent.slug == ENTITY_CLASS_WRAPPER_TERM_SLUG_PATTERN.format(category_term.slug):
+            wrapper = parent
+        else:
+            wrapper = get_or_create_term_wrapper(category_term)
+        self._wrappers[category_term.id] = wrapper
+        return wrapper
+
+    def get_or_create_child(self, parent, slug, name, **defaults):
+        key = (parent.id, slug)
+        term = self._children.get(key)
+        if term is None:
+            term, created = parent.get_children().get_or_create(slug=slug, defaults=dict(
+                defaults, parent_id=parent.id, name=name, system_flags=_default_system_flags_restriction))
+            self._children[key] = term
+        return term
+
+    def resolve(self, group_props):
+        """
+        Returns the list of group property terms referred by `group_props`, creating or renaming
+        them where required.
+        """
+        self.prefetch(group_props)
+        terms = []
+        for group_prop in group_props:
+            for category in self.get_categories(group_prop):
+                root_category = self.get_wrapper(self.get_category(category))
+                group_root_tag = self.get_or_create_child(
+                    root_category, group_prop['parent_guid'], group_prop['parent_name'],
+                    semantic_rule=TermModel.OR_RULE,
+                    attributes=TermModel.attributes.is_characteristic,
+                    specification_mode=TermModel.SPECIFICATION_MODES[1][0])
+                product_group_term = self.get_or_create_child(
+                    group_root_tag, group_prop['guid'], group_prop['name'], semantic_rule=TermModel.OR_RULE)
+                if product_group_term.name != group_prop['name']:
+                    product_group_term.name = group_prop['name']
+                    product_group_term.save()
+                terms.append(product_group_term)
+        return terms
+
+
+class SystemTermRegistry(object):
+    """
+    Process wide registry of the system terms used on each save of a product: the model wrapper
+    terms, the in stock choices and the view layout terms. The terms are loaded once per process
+    and dropped whenever a term is saved or deleted. Other processes notice the change through
+    the version stored in the Django cache under `version_key` when the transaction commits.
+    """
+    version_key = 'edw_shop:system_terms:version'
+
+    def __init__(self):
+        self._terms = {}
+        self._version = None
+        self._lock = threading.Lock()
+
+    def check_version(self):
+        version = cache.get(self.version_key)
+        if version != self._version:
+            with self._lock:
+                self._terms.clear()
+                self._version = version
+
+    def get(self, key, loader):
+        self.check_version()
+        try:
+            return self._terms[key]
+        except KeyError:
+            value = loader()
+            with self._lock:
+                self._terms[key] = value
+            return value
+
+    def get_model_wrapper(self, model):
+        """
+        Returns the wrapper term of the entity class `model`.
+        """
+        return self.get(('wrapper', model._meta.label_lower), lambda: get_or_create_model_class_wrapper_term(model))
+
+    def get_in_stock_choices(self, model):
+        """
+        Returns a dictionary mapping the slugs of the in stock root term of `model` and of its choices
+        onto the terms, or an empty dictionary if the root term does not exist.
+        """
+        def load():
+            try:
+                root = TermModel.objects.get(slug=model.IN_STOCK_ROOT_TERM[0], parent=self.get_model_wrapper(model))
+            except TermModel.DoesNotExist:
+                return {}
+            return dict((term.slug, term) for term in root.get_descendants(include_self=True))
+        return self.get(('in_stock', model._meta.label_lower), load)
+
+    def get_views_layouts(self):
+        """
+        Returns the dictionary of the view layout terms by slug, see ``get_views_layouts``.
+        """
+        return self.get('views_layouts', get_views_layouts)
+
+    def invalidate(self):
+        with self._lock:
+            self._terms.clear()
+            self._version = None
+        # store the new version once the changes are visible to other processes, otherwise they
+        # could reload the old terms under the new version and keep them
+        transaction.on_commit(lambda: cache.set(self.version_key, uuid.uuid4().hex, None))
+
+
+system_terms = SystemTermRegistry()
+
+
+def invalidate_system_terms(sender, **kwargs):
+    system_terms.invalidate()
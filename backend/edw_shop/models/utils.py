@@ -1,7 +1,7 @@
 # -*- coding: utf-8 -*-
 from __future__ import unicode_literals
 
-from django.db import transaction
+from django.db import models, transaction
 from django.utils.encoding import force_text
 from django.utils.translation import ugettext_lazy as _
 
@@ -53,3 +53,70 @@ def get_or_create_term_wrapper(original_term,
         root_term = term_parent
 
     return root_term
+
+
+def bulk_update_fields(model, objs, fields, batch_size=500):
+    """
+    Update the given `fields` of the already saved objects `objs` with one UPDATE statement per
+    batch, rather than saving each object. Uses ``QuerySet.bulk_update`` if available, otherwise
+    builds ``CASE WHEN pk = ... THEN ...`` expressions.
+    """
+    objs = [obj for obj in objs if obj.pk is not None]
+    if not objs or not fields:
+        return
+    if hasattr(models.QuerySet, 'bulk_update'):
+        model._default_manager.bulk_update(objs, fields, batch_size=batch_size)
+        return
+    with transaction.atomic():
+        for start in range(0, len(objs), batch_size):
+            batch = objs[start:start + batch_size]
+            updates = {}
+            for name in fields:
+                field = model._meta.get_field(name)
+                updates[field.attname] = models.Case(
+                    *[models.When(pk=obj.pk, then=models.Value(getattr(obj, field.attname))) for obj in batch],
+                    output_field=field)
+            model._default_manager.filter(pk__in=[obj.pk for obj in batch]).update(**updates)
+
+
+def get_m2m_through(model, field_name):
+    """
+    Returns the through model of the many-to-many field `field_name` together with the names of
+    its foreign keys pointing onto `model` and onto the related model.
+    """
+    field = model._meta.get_field(field_name)
+    through = field.remote_field.through
+    source = through._meta.get_field(field.m2m_field_name()).attname
+    target = through._meta.get_field(field.m2m_reverse_field_name()).attname
+    return through, source, target
+
+
+def bulk_set_m2m(model, field_name, links, scope=None, batch_size=500):
+    """
+    Synchronize the many-to-many field `field_name` of many objects at once. `links` maps the
+    primary keys of the objects onto the set of related primary keys they shall be linked to.
+    If `scope` is given, only links onto related objects from this collection of primary keys are
+    removed, otherwise all links of the given objects not in `links` are removed.
+    Unlike ``RelatedManager.add`` and ``remove``, no ``m2m_changed`` signals are sent.
+    Returns the number of added and removed links.
+    """
+    if not links:
+        return 0, 0
+    through, source, target = get_m2m_through(model, field_name)
+    existing = through._default_manager.filter(**{'{}__in'.format(source): list(links.keys())})
+    if scope is not None:
+        existing = existing.filter(**{'{}__in'.format(target): list(scope)})
+    stale, present = [], set()
+    for pk, source_id, target_id in existing.values_list('pk', source, target).iterator():
+        if target_id in links.get(source_id, ()):
+            present.add((source_id, target_id))
+        else:
+            stale.append(pk)
+    missing = [through(**{source: source_id, target: target_id})
+               for source_id, target_ids in links.items() for target_id in target_ids
+               if (source_id, target_id) not in present]
+    with transaction.atomic():
+        for start in range(0, len(stale), batch_size):
+            through._default_manager.filter(pk__in=stale[start:start + batch_size]).delete()
+        through._default_manager.bulk_create(missing, batch_size=batch_size)
+    return len(missing), len(stale)
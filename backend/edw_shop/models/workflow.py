@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from collections import OrderedDict
+from decimal import Decimal
+
+from django.db.models import Sum
+
+
+class TransitionGraph(object):
+    """
+    The transitions of an Order model, including those mixed in through `SHOP_ORDER_WORKFLOWS`,
+    compiled once per concrete model and indexed by their source state. Transition conditions are
+    evaluated lazily and memoized on the order instance, so that each condition runs at most once
+    until the order is saved, transitioned or paid.
+    """
+    _graphs = {}
+
+    def __init__(self, model):
+        self.model = model
+        self.transitions = tuple(model.status.field.get_all_transitions(model))
+        self._wildcards = tuple(t for t in self.transitions if t.source in ('*', '+'))
+        self._by_state = {}
+        for transition in self.transitions:
+            if transition.source not in ('*', '+'):
+                self._by_state.setdefault(transition.source, []).append(transition)
+        for state in list(self._by_state.keys()):
+            self._by_state[state] = self._with_wildcards(state, self._by_state[state])
+
+    @classmethod
+    def for_model(cls, model):
+        try:
+            return cls._graphs[model]
+        except KeyError:
+            graph = cls._graphs[model] = cls(model)
+            return graph
+
+    def _with_wildcards(self, state, transitions):
+        return tuple(transitions) + tuple(t for t in self._wildcards if not (t.source == '+' and t.target == state))
+
+    def get_transitions(self, state):
+        """
+        Returns all transitions leaving `state`, regardless of their conditions.
+        """
+        try:
+            return self._by_state[state]
+        except KeyError:
+            transitions = self._by_state[state] = self._with_wildcards(state, ())
+            return transitions
+
+    def check_conditions(self, order, transition):
+        memo = order.__dict__.setdefault('_transition_conditions', {})
+        for condition in transition.conditions:
+            if condition not in memo:
+                memo[condition] = bool(condition(order))
+            if not memo[condition]:
+                return False
+        return True
+
+    def get_available_transitions(self, order, user=None):
+        """
+        Returns the transitions which can be applied on `order` in its current state. If `user`
+        is given, only transitions this user is permitted to invoke are returned.
+        """
+        return [t for t in self.get_transitions(order.status)
+                if self.check_conditions(order, t) and (user is None or t.has_perm(order, user))]
+
+    def prefetch_amount_paid(self, orders):
+        """
+        Compute the property `amount_paid`, used by many transition conditions, for all orders
+        with one grouped query.
+        """
+        orders = [o for o in orders if 'amount_paid' not in o.__dict__]
+        if orders:
+            from edw_shop.models.order import OrderPayment
+
+            amounts = dict(OrderPayment.objects.filter(order__in=[o.pk for o in orders]).values(
+                'order').annotate(amount=Sum('amount')).values_list('order', 'amount'))
+            for order in orders:
+                order.__dict__['amount_paid'] = amounts.get(order.pk) or Decimal(0)
+
+    def get_available_transitions_for(self, orders, user=None):
+        """
+        Returns an ordered mapping of order primary keys to the names of the transitions
+        available for each of the given orders.
+        """
+        orders = list(orders)
+        self.prefetch_amount_paid(orders)
+        return OrderedDict((order.pk, [t.name for t in self.get_available_transitions(order, user)])
+                           for order in orders)
+
+
+def clear_transition_conditions(sender, instance, **kwargs):
+    """
+    Forget the transition conditions memoized on `instance`, after it has been transitioned.
+    """
+    instance.__dict__.pop('_transition_conditions', None)
@@ -5,6 +5,8 @@ Source: https://github.com/awesto/django-shop/blob/c59a68fb8337409b4fe35c261e953
 from __future__ import unicode_literals
 
 from django.utils.translation import ugettext_lazy as _
+from edw_shop.conf import app_settings
+from edw_shop.models.pricing import price_index
 from edw_shop.modifiers.base import PaymentModifier, ShippingModifier
 from edw_shop.money import AbstractMoney, Money
 from edw_shop.payment.defaults import ForwardFundPayment
@@ -19,6 +21,12 @@ class DefaultCartModifier(BaseCartModifier):
     Since this modifier sets the cart items line total, it must be listed as the first
     entry in `SHOP_CART_MODIFIERS`.
     """
+    def arrange_cart_items(self, cart_items, request):
+        if app_settings.PRICE_LISTS:
+            # resolve the prices of all products at once, `get_price` then reads them from the request
+            price_index.get_prices([cart_item.product for cart_item in cart_items], request)
+        return super(DefaultCartModifier, self).arrange_cart_items(cart_items, request)
+
     def process_cart_item(self, cart_item, request):
         cart_item.unit_price = cart_item.product.get_price(request)
         cart_item.line_total = cart_item.unit_price * cart_item.quantity
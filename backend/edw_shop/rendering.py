@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+"""
+Process wide registry of the templates used by the shop for rendering snippets, addresses and
+printable documents, and the requests emulated for rendering them offline.
+"""
+from __future__ import unicode_literals
+
+import threading
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.http import HttpRequest
+from django.template import Context
+from django.template.loader import select_template
+from django.utils.six.moves.urllib.parse import urlparse
+
+
+class TemplateRegistry(object):
+    """
+    Resolves the first existing template out of a list of candidates and memoizes the compiled
+    template under the key ``(app_label, product_model, purpose)``, so that rendering a snippet
+    for each row of a list does not repeat the lookup through all template loaders.
+    The memo is bypassed while ``settings.DEBUG`` is set and cleared whenever settings or template
+    files change.
+    """
+    def __init__(self):
+        self._templates = {}
+        self._lock = threading.Lock()
+
+    def get_template(self, key, template_names):
+        """
+        Returns the compiled template for `key`. The tuple `key` must identify the candidates in
+        `template_names` unambiguously, usually it is ``(app_label, product_model, purpose)``.
+        Raises ``TemplateDoesNotExist`` if none of the candidates exists.
+        """
+        if settings.DEBUG:
+            return select_template(template_names)
+        try:
+            return self._templates[key]
+        except KeyError:
+            template = select_template(template_names)
+            with self._lock:
+                self._templates[key] = template
+            return template
+
+    def render(self, key, template_names, context=None, request=None):
+        return self.get_template(key, template_names).render(context, request)
+
+    def render_many(self, key, template_names, contexts, request=None):
+        """
+        Render the same template for each context in `contexts` and return the list of results.
+        For templates of the Django backend, one Context object is reused for all renderings.
+        """
+        template = self.get_template(key, template_names)
+        backend_template = getattr(template, 'template', None)
+        if backend_template is None or request is not None:
+            return [template.render(context, request) for context in contexts]
+        engine = backend_template.engine
+        context = Context(autoescape=engine.autoescape)
+        results = []
+        for values in contexts:
+            with context.push(values or {}):
+                results.append(backend_template.render(context))
+        return results
+
+    def clear(self):
+        with self._lock:
+            self._templates.clear()
+
+
+template_registry = TemplateRegistry()
+
+
+def _clear_template_registry(sender, **kwargs):
+    template_registry.clear()
+
+
+setting_changed.connect(_clear_template_registry, dispatch_uid='edw_shop_clear_template_registry')
+
+try:
+    from django.utils.autoreload import file_changed
+except ImportError:  # Django < 2.2 restarts the process instead
+    pass
+else:
+    file_changed.connect(_clear_template_registry, dispatch_uid='edw_shop_clear_template_registry')
+
+
+class EmulatedRequest(HttpRequest):
+    """
+    A request built outside of the request/response cycle. As for a WSGI request, its scheme is
+    taken from ``META['wsgi.url_scheme']``.
+    """
+    def _get_scheme(self):
+        return self.META.get('wsgi.url_scheme', 'http')
+
+
+def emulate_request(base_uri, language=None, **meta):
+    """
+    Returns a GET request onto the root of `base_uri` in `language`, used to render snippets and
+    documents by workers and management commands. Additional `meta` update ``request.META``.
+    """
+    base_uri = urlparse(base_uri or '')
+    request = EmulatedRequest()
+    request.method = 'GET'
+    request.path = request.path_info = '/'
+    request.META.update({
+        'SERVER_NAME': base_uri.hostname or 'localhost',
+        'SERVER_PORT': str(base_uri.port or (443 if base_uri.scheme == 'https' else 80)),
+        'REMOTE_ADDR': '127.0.0.1',
+        'wsgi.url_scheme': base_uri.scheme or 'http',
+    })
+    if base_uri.netloc:
+        request.META['HTTP_HOST'] = base_uri.netloc
+    if language:
+        request.META['HTTP_ACCEPT_LANGUAGE'] = language
+        request.LANGUAGE_CODE = language
+    request.META.update(meta)
+    return request
@@ -1,18 +1,21 @@
 # -*- coding: utf-8 -*-
 from rest_framework import serializers
 from django.core import exceptions
-from django.core.cache import cache
+from django.db import models
 from django.template import TemplateDoesNotExist
-from django.template.loader import select_template
 from django.utils.html import strip_spaces_between_tags
-from django.utils import six
 from django.utils.safestring import mark_safe, SafeText
-from django.utils.translation import get_language_from_request
+from django.utils.translation import get_language, get_language_from_request
 
+from edw_shop.cache import product_cache
+from edw_shop.models.pricing import price_index
 from edw_shop.models.product import ProductModel
 from edw_shop.conf import app_settings
+from edw_shop.rendering import template_registry
 
 from edw.rest.serializers.entity import EntitySummarySerializer
+from edw.rest.serializers.related.entity_file import EntityFileSerializer
+from edw.rest.serializers.related.entity_image import EntityImageSerializer
 
 class ProductUnitSerializer(serializers.Serializer):
     """
@@ -36,11 +39,37 @@ class ProductGroupPropertySerializer(serializers.Serializer):
     )
 
 
+class ProductMediaListSerializer(serializers.ListSerializer):
+    """
+    Serializes the images or files of a product. If the product is serialized as part of a list,
+    the media of all products of that list are prefetched by ``prefetch_media`` on first access,
+    rather than being queried product by product.
+    """
+    def get_attribute(self, instance):
+        products = getattr(self.parent, 'parent', None)
+        if isinstance(products, serializers.ListSerializer) and not getattr(products, '_media_prefetched', False):
+            products._media_prefetched = True
+            # a queryset caches its result, hence the same objects are serialized afterwards
+            if isinstance(products.instance, (list, tuple, models.QuerySet)):
+                type(instance).prefetch_media([obj for obj in products.instance if hasattr(obj, 'prefetch_media')])
+        return super(ProductMediaListSerializer, self).get_attribute(instance)
+
+
+class ProductImageSerializer(EntityImageSerializer):
+    class Meta(EntityImageSerializer.Meta):
+        list_serializer_class = ProductMediaListSerializer
+
+
+class ProductFileSerializer(EntityFileSerializer):
+    class Meta(EntityFileSerializer.Meta):
+        list_serializer_class = ProductMediaListSerializer
+
+
 class ProductSerializer(serializers.ModelSerializer):
     """
     Common serializer for our product model.
     """
-    price = serializers.DecimalField(source='get_unit_price', max_digits=10, decimal_places=3, read_only=True)
+    price = serializers.SerializerMethodField()
     availability = serializers.SerializerMethodField()
     product_type = serializers.CharField(read_only=True)
     product_model = serializers.CharField(read_only=True)
@@ -57,13 +86,32 @@ class ProductSerializer(serializers.ModelSerializer):
         kwargs.setdefault('label', 'catalog')
         super(ProductSerializer, self).__init__(*args, **kwargs)
 
+    @classmethod
+    def get_summary(cls, product, context, label):
+        """
+        Returns the serialized summary of `product`, cached for ``CACHE_DURATIONS['product_summary']``
+        seconds under the revision of the product.
+        """
+        timeout = app_settings.CACHE_DURATIONS['product_summary']
+        if not timeout:
+            return cls(product, context=context, read_only=True, label=label).data
+        request = context.get('request')
+        cache_key = 'product-summary:{0}:{1}|{2}-{3}-{4}-{5}'.format(product.id, product.get_revision(),
+            cls.__name__, label, get_language_from_request(request) if request is not None else get_language(),
+            price_index.get_cache_component(request))
+        data = product_cache.get(cache_key)
+        if data is None:
+            data = dict(cls(product, context=context, read_only=True, label=label).data)
+            product_cache.set(cache_key, data, timeout)
+        return data
+
     def get_price(self, product):
-        #TODO: not used with request
-        price = product.get_price(self.context['request'])
-        # TODO: check if this can be simplified using str(product.get_price(...))
-        if six.PY2:
-            return u'{:f}'.format(price)
-        return '{:f}'.format(price)
+        """
+        Returns the price of the product for the customer of the request, see ``SHOP_PRICE_LISTS``.
+        """
+        request = self.context.get('request')
+        price = product.get_price(request) if request is not None else product.get_unit_price()
+        return serializers.DecimalField(max_digits=10, decimal_places=3).to_representation(price)
 
     def get_availability(self, product):
         return product.get_availability(self.context['request'])
@@ -81,9 +129,10 @@ class ProductSerializer(serializers.ModelSerializer):
             raise exceptions.ImproperlyConfigured(msg)
         app_label = product._meta.app_label.lower()
         request = self.context['request']
-        cache_key = 'product:{0}|{1}-{2}-{3}-{4}-{5}'.format(product.id, app_label, self.label,
-            product.product_model, postfix, get_language_from_request(request))
-        content = cache.get(cache_key)
+        cache_key = 'product:{0}:{1}|{2}-{3}-{4}-{5}-{6}-{7}'.format(product.id, product.get_revision(), app_label,
+            self.label, product.product_model, postfix, get_language_from_request(request),
+            price_index.get_cache_component(request))
+        content = product_cache.get(cache_key)
         if content:
             return mark_safe(content)
         params = [
@@ -92,7 +141,9 @@ class ProductSerializer(serializers.ModelSerializer):
             ('shop', self.label, 'product', postfix),
         ]
         try:
-            template = select_template(['{0}/products/{1}-{2}-{3}.html'.format(*p) for p in params])
+            template = template_registry.get_template(
+                (app_label, product.product_model, '{}-{}'.format(self.label, postfix)),
+                ['{0}/products/{1}-{2}-{3}.html'.format(*p) for p in params])
         except TemplateDoesNotExist:
             return SafeText("<!-- no such template: '{0}/products/{1}-{2}-{3}.html' -->".format(*params[0]))
         # when rendering emails, we require an absolute URI, so that media can be accessed from
@@ -100,5 +151,5 @@ class ProductSerializer(serializers.ModelSerializer):
         absolute_base_uri = request.build_absolute_uri('/').rstrip('/')
         context = {'product': product, 'ABSOLUTE_BASE_URI': absolute_base_uri}
         content = strip_spaces_between_tags(template.render(context, request).strip())
-        cache.set(cache_key, content, app_settings.CACHE_DURATIONS['product_html_snippet'])
+        product_cache.set(cache_key, content, app_settings.CACHE_DURATIONS['product_html_snippet'])
         return mark_safe(content)
\ No newline at end of file
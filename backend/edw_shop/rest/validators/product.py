@@ -6,6 +6,7 @@ from django.core.exceptions import (
     ObjectDoesNotExist,
     MultipleObjectsReturned
 )
+from django.db.models import Q
 from django.db.models.fields import NOT_PROVIDED
 from django.db.models.fields.related import RelatedField
 from django.db.models.fields.reverse_related import ForeignObjectRel
@@ -13,6 +14,8 @@ from edw.models.entity import EntityModel
 
 from edw.models.term import TermModel
 from edw.rest.serializers.decorators import empty
+from django.utils import six
+from django.utils.encoding import force_text
 from django.utils.translation import ugettext_lazy as _
 
 from rest_framework import serializers
@@ -20,6 +23,186 @@ from rest_framework import serializers
 from edw.rest.serializers.entity import EntityValidator
 
 
+def _does_not_exist(model):
+    # the same message as raised by ``QuerySet.get()``
+    return model.DoesNotExist("%s matching query does not exist." % model._meta.object_name)
+
+
+def _multiple_objects_returned(model, num):
+    return model.MultipleObjectsReturned(
+        "get() returned more than one %s -- it returned %s!" % (model._meta.object_name, num))
+
+
+# =========================================================================================================
+# Product validator lookups
+# =========================================================================================================
+class ProductValidatorLookups(object):
+    """
+    Memoized lookups of the instances, terms and entities referred by the validated products.
+    `prefetch` resolves the references of many payloads with one query per kind of reference,
+    afterwards the lookups raise the same exceptions as the ``get()`` queries they replace, so that
+    the error messages of the validator do not change. References missing in the memo are queried
+    on demand.
+    """
+    context_key = 'product_validator_lookups'
+
+    def __init__(self, model, id_attrs=()):
+        self.model = model
+        self.id_attrs = tuple(id_attrs)
+        self._instances = {}  # (id attr, value) -> list of instances
+        self._terms = {}  # (kind, field, path) -> list of term ids
+        self._ids = {'relations': set(), 'subjects': set()}  # kind -> queried ids
+        self._found_ids = {'relations': set(), 'subjects': set()}  # kind -> existing ids
+        self._available_terms_ids = None
+
+    def get_available_terms_ids(self, serializer):
+        """
+        Returns the set of the terms available in the data mart of the request.
+        """
+        if self._available_terms_ids is None:
+            self._available_terms_ids = set(serializer.data_mart_available_terms_ids)
+        return self._available_terms_ids
+
+    @classmethod
+    def for_serializer(cls, serializer):
+        """
+        Returns the lookups shared through the serializer context. If the serializer is the child of
+        a list serializer, the references of all items are prefetched at once.
+        """
+        context = serializer.context
+        lookups = context.get(cls.context_key)
+        if lookups is None:
+            lookups = context[cls.context_key] = cls(serializer.Meta.model, serializer.get_id_attrs())
+            items = getattr(getattr(serializer, 'parent', None), 'initial_data', None)
+            if isinstance(items, (list, tuple)):
+                lookups.prefetch(items, serializer)
+        return lookups
+
+    @staticmethod
+    def get_path_field(path):
+        return 'slug' if path.find('/') == -1 else 'path'
+
+    @staticmethod
+    def get_terms_queryset(kind):
+        if kind == 'characteristics':
+            return TermModel.objects.active().attribute_filter(TermModel.attributes.is_characteristic)
+        if kind == 'marks':
+            return TermModel.objects.active().attribute_filter(TermModel.attributes.is_mark)
+        return TermModel.objects.active().no_external_tagging_restriction()
+
+    @staticmethod
+    def get_ids_queryset(kind):
+        if kind == 'relations':
+            return TermModel.objects.active().attribute_is_relation()
+        return EntityModel.objects.active()
+
+    def prefetch(self, payloads, serializer=None):
+        id_values = dict((id_attr, set()) for id_attr in self.id_attrs)
+        paths = {'characteristics': set(), 'marks': set(), 'terms_paths': set()}
+        ids = {'relations': set(), 'subjects': set()}
+        for payload in payloads:
+            if not isinstance(payload, dict):
+                continue
+            for id_attr in self.id_attrs:
+                id_value = payload.get(id_attr, None)
+                if id_value is not None:
+                    id_values[id_attr].add(id_value)
+                    break
+            for kind in ('characteristics', 'marks'):
+                for attribute in payload.get(kind, None) or ():
+                    path = attribute.get('path', None) if isinstance(attribute, dict) else None
+                    if isinstance(path, six.string_types):
+                        paths[kind].add(path)
+            paths['terms_paths'].update(
+                path for path in payload.get('terms_paths', None) or () if isinstance(path, six.string_types))
+            relations = payload.get('relations', None)
+            if relations and serializer is not None:
+                try:
+                    rel_subj, rel_f_ids, rel_r_ids = serializer.parse_relations(relations)
+                except (TypeError, ValueError, AttributeError, KeyError):
+                    continue
+                ids['relations'].update(rel_f_ids)
+                ids['relations'].update(rel_r_ids)
+                for subj_ids in rel_subj.values():
+                    ids['subjects'].update(subj_ids)
+
+        for id_attr, values in id_values.items():
+            self.prefetch_instances(id_attr, values)
+        for kind, kind_paths in paths.items():
+            self.prefetch_terms(kind, kind_paths)
+        for kind, kind_ids in ids.items():
+            self.get_existing_ids(kind, kind_ids)
+
+    def prefetch_instances(self, id_attr, values):
+        values = [value for value in values if (id_attr, force_text(value)) not in self._instances]
+        if not values:
+            return
+        found = {}
+        for instance in self.model.objects.filter(**{'{}__in'.format(id_attr): values}):
+            found.setdefault(force_text(getattr(instance, id_attr)), []).append(instance)
+        for value in values:
+            self._instances[(id_attr, force_text(value))] = found.get(force_text(value), [])
+
+    def get_instance(self, id_attr, value):
+        """
+        Returns the instance having `value` in the attribute `id_attr`, like ``model.objects.get()``.
+        """
+        key = (id_attr, force_text(value))
+        if key not in self._instances:
+            self._instances[key] = list(self.model.objects.filter(**{id_attr: value}))
+        instances = self._instances[key]
+        if not instances:
+            raise _does_not_exist(self.model)
+        if len(instances) > 1:
+            raise _multiple_objects_returned(self.model, len(instances))
+        return instances[0]
+
+    def prefetch_terms(self, kind, paths):
+        lookups = {'slug': set(), 'path': set()}
+        for path in paths:
+            if (kind, self.get_path_field(path), path) not in self._terms:
+                lookups[self.get_path_field(path)].add(path)
+        if not (lookups['slug'] or lookups['path']):
+            return
+        for field, values in lookups.items():
+            for value in values:
+                self._terms[(kind, field, value)] = []
+        query = Q(slug__in=lookups['slug']) | Q(path__in=lookups['path'])
+        for term_id, slug, path in self.get_terms_queryset(kind).filter(query).values_list('id', 'slug', 'path'):
+            for field, value in (('slug', slug), ('path', path)):
+                if value in lookups[field]:
+                    self._terms[(kind, field, value)].append(term_id)
+
+    def get_term_id(self, kind, path, available_terms_ids):
+        """
+        Returns the id of the available term of `kind` found by `slug` or `path`, like the ``get()``
+        query filtered by ``id__in=available_terms_ids``.
+        """
+        field = self.get_path_field(path)
+        key = (kind, field, path)
+        if key not in self._terms:
+            self.prefetch_terms(kind, [path])
+        terms_ids = [term_id for term_id in self._terms[key] if term_id in available_terms_ids]
+        if not terms_ids:
+            raise _does_not_exist(TermModel)
+        if len(terms_ids) > 1:
+            raise _multiple_objects_returned(TermModel, len(terms_ids))
+        return terms_ids[0]
+
+    def get_existing_ids(self, kind, ids):
+        """
+        Returns the subset of `ids` existing as active relation terms or as active entities,
+        depending on `kind` (``relations`` or ``subjects``).
+        """
+        ids = set(ids)
+        missing = ids - self._ids[kind]
+        if missing:
+            self._found_ids[kind].update(self.get_ids_queryset(kind).filter(
+                id__in=missing).values_list('id', flat=True))
+            self._ids[kind].update(missing)
+        return ids & self._found_ids[kind]
+
+
 # =========================================================================================================
 # Publication validator
 # =========================================================================================================
@@ -32,7 +215,24 @@ class ProductValidator(EntityValidator):
         """
         serializer.Meta.lookup_fields = ('id', 'uuid', 'slug')
         self.serializer = serializer
+        self.lookups = ProductValidatorLookups.for_serializer(serializer)
 
+    def validate_many(self, payloads):
+        """
+        Validate many payloads with the serializer passed to `set_context`. The references of all
+        payloads are resolved with a few set-based queries. Returns the list of error maps, an empty
+        dictionary for each valid payload.
+        """
+        self.lookups.prefetch(payloads, self.serializer)
+        results = []
+        for attrs in payloads:
+            try:
+                self(attrs)
+            except serializers.ValidationError as e:
+                results.append(e.detail if isinstance(e.detail, dict) else {'non_field_errors': e.detail})
+            else:
+                results.append({})
+        return results
 
     def __call__(self, attrs):
 
@@ -43,7 +243,7 @@ class ProductValidator(EntityValidator):
         validated_data = dict(attrs)
         request_method = self.serializer.request_method
 
-        available_terms_ids = set(self.serializer.data_mart_available_terms_ids)
+        available_terms_ids = self.lookups.get_available_terms_ids(self.serializer)
         attr_errors = {}
 
         # check update for POST method
@@ -53,7 +253,7 @@ class ProductValidator(EntityValidator):
 
                 if id_value != empty:
                     try:
-                        instance = model.objects.get(**{id_attr: id_value})
+                        instance = self.lookups.get_instance(id_attr, id_value)
                     except ObjectDoesNotExist:
                         pass
                     except MultipleObjectsReturned as e:
@@ -71,14 +271,10 @@ class ProductValidator(EntityValidator):
                     break
 
         # characteristics, marks
-        for (attr_name, attribute_mode) in [
-            ('characteristics', TermModel.attributes.is_characteristic),
-            ('marks', TermModel.attributes.is_mark)
-        ]:
+        for attr_name in ('characteristics', 'marks'):
             attributes = validated_data.pop(attr_name, None)
             if attributes is not None:
                 errors = []
-                terms = TermModel.objects.active().attribute_filter(attribute_mode)
                 for attribute in attributes:
                     error = {}
                     path = attribute.get('path', None)
@@ -87,7 +283,7 @@ class ProductValidator(EntityValidator):
                         field = 'slug' if path.find('/') == -1 else 'path'
 
                         try:
-                            terms.get(**{field: path, 'id__in': available_terms_ids})
+                            self.lookups.get_term_id(attr_name, path, available_terms_ids)
                         except (ObjectDoesNotExist, MultipleObjectsReturned) as e:
                             error.update({'path': _("{} `{}`='{}'").format(str(e), field, path)})
 
@@ -104,12 +300,11 @@ class ProductValidator(EntityValidator):
         terms_paths = validated_data.pop('terms_paths', None)
         if terms_paths is not None:
             errors = []
-            terms = TermModel.objects.active().no_external_tagging_restriction()
             for path in terms_paths:
                 # Try find Term by `slug` or `path`
                 field = 'slug' if path.find('/') == -1 else 'path'
                 try:
-                    terms.get(**{field: path, 'id__in': available_terms_ids})
+                    self.lookups.get_term_id('terms_paths', path, available_terms_ids)
                 except (ObjectDoesNotExist, MultipleObjectsReturned) as e:
                     errors.append(_("{} `{}`='{}'").format(str(e), field, path))
             if errors:
@@ -132,8 +327,7 @@ class ProductValidator(EntityValidator):
 
             # validate relations ids
             rel_b_ids = rel_f_ids | rel_r_ids
-            not_found_ids = list(rel_b_ids - set(TermModel.objects.active().attribute_is_relation().filter(
-                id__in=rel_b_ids).values_list('id', flat=True)))
+            not_found_ids = list(rel_b_ids - self.lookups.get_existing_ids('relations', rel_b_ids))
             if not_found_ids:
                 errors.append(_("Terms with id`s [{}] not found.").format(', '.join(str(x) for x in not_found_ids)))
 
@@ -141,8 +335,7 @@ class ProductValidator(EntityValidator):
             subj_ids = []
             for ids in rel_subj.values():
                 subj_ids.extend(ids)
-            not_found_ids = list(set(subj_ids) - set(EntityModel.objects.active().filter(
-                id__in=subj_ids).values_list('id', flat=True)))
+            not_found_ids = list(set(subj_ids) - self.lookups.get_existing_ids('subjects', subj_ids))
             if not_found_ids:
                 errors.append(_("Entities with id`s [{}] not found.").format(', '.join(str(x) for x in not_found_ids)))
 
@@ -94,9 +94,7 @@ class BaseItemSerializer(ItemModelSerializer):
 
     def get_summary(self, cart_item):
         serializer_class = app_settings.PRODUCT_SUMMARY_SERIALIZER
-        serializer = serializer_class(cart_item.product, context=self.context,
-                                      read_only=True, label=self.root.label)
-        return serializer.data
+        return serializer_class.get_summary(cart_item.product, self.context, self.root.label)
 
 
 class CartItemSerializer(BaseItemSerializer):
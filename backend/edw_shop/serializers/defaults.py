@@ -114,6 +114,4 @@ class OrderItemSerializer(BaseOrderItemSerializer):
         label = self.context.get('render_label', 'order')
         serializer_class = app_settings.PRODUCT_SUMMARY_SERIALIZER # EntitySummarySerializer
         # todo: EntitySummarySerializer для изменения необходимо переделать шаблон детали заказа
-        serializer = serializer_class(order_item.product, context=self.context,
-                                      read_only=True, label=label)
-        return serializer.data
+        return serializer_class.get_summary(order_item.product, self.context, label)
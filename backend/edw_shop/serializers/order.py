@@ -73,7 +73,8 @@ class OrderDetailSerializer(OrderListSerializer):
 
     class Meta:
         model = OrderModel
-        exclude = ['id', 'customer', 'stored_request', '_subtotal', '_total']
+        exclude = ['id', 'customer', 'stored_request', 'purchase_key', 'purchase_response', 'search_document',
+                   '_subtotal', '_total']
         read_only_fields = ['shipping_address_text', 'billing_address_text']  # TODO: not part of OrderBase
 
     def get_partially_paid(self, order):
@@ -92,3 +93,19 @@ class OrderDetailSerializer(OrderListSerializer):
             order.cancel_order()
             order.save()
         return order
+
+
+class OrderBulkTransitionSerializer(serializers.Serializer):
+    """
+    Validates the payload for moving many orders through one transition at once.
+    """
+    transition = serializers.CharField()
+    ids = serializers.ListField(
+        child=serializers.IntegerField(),
+        allow_empty=False,
+    )
+
+    def validate_transition(self, transition):
+        if transition not in set(t.name for t in OrderModel.get_all_transitions()):
+            raise serializers.ValidationError("Unknown transition `{}`.".format(transition))
+        return transition
@@ -0,0 +1,19 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from rest_framework import serializers
+
+from edw_shop.exchange.stock import StockUpdater
+
+
+class ProductStockUpdateSerializer(serializers.Serializer):
+    """
+    Validates the payload for updating the quantity in stock and the price of many products.
+    Each item carries the key column and any of the fields ``in_stock`` and ``unit_price``,
+    the items are validated one by one by the ``StockUpdater``.
+    """
+    key = serializers.ChoiceField(choices=StockUpdater.keys, default='sid')
+    items = serializers.ListField(
+        child=serializers.DictField(),
+        allow_empty=False,
+    )
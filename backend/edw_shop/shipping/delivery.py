@@ -4,8 +4,6 @@ Source: https://github.com/awesto/django-shop/blob/c9f5eab25a3513b548343ac02f313
 """
 from __future__ import unicode_literals
 
-from django.db.models import Sum
-from django.utils.functional import cached_property
 from django.utils.translation import ugettext_lazy as _
 from django_fsm import transition
 from edw_shop.models.delivery import DeliveryModel
@@ -25,14 +23,20 @@ class PartialDeliveryWorkflowMixin(object):
         'ship_goods': _("Ship goods"),
     }
 
-    @cached_property
+    @property
     def unfulfilled_items(self):
-        unfulfilled_items = 0
-        for order_item in self.items.all():
-            if not order_item.canceled:
-                aggr = order_item.deliveryitem_set.aggregate(delivered=Sum('quantity'))
-                unfulfilled_items += order_item.quantity - (aggr['delivered'] or 0)
-        return unfulfilled_items
+        """
+        The counter `unfulfilled_quantity`. Orders created before the counters existed must be
+        populated once by ``manage.py check_delivery_counters --repair``.
+        """
+        return self.unfulfilled_quantity
+
+    def clear_delivery_cache(self):
+        """
+        Forget the memoized delivery progress, after items have been delivered or canceled.
+        """
+        self.refresh_from_db(fields=['unfulfilled_quantity'])
+        self.__dict__.pop('_transition_conditions', None)
 
     def ready_for_delivery(self):
         return self.is_fully_paid() and self.unfulfilled_items > 0
@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from collections import OrderedDict
+
+from django.db.models import F, Sum
+
+from edw_shop.conf import app_settings
+from edw_shop.models.order import OrderModel, OrderItemModel
+from edw_shop.rendering import template_registry
+
+
+class PickingList(object):
+    """
+    Consolidated picking list for a wave of orders in status ``pick_goods``.
+    The outstanding quantity per product is summed up by one grouped query over the delivered
+    quantity counters, sorted and grouped by `SHOP_PICKING_LIST_ORDERING`. A second query fetches
+    the outstanding items of each order for the packing slips.
+    As everywhere in the delivery workflow, the counters are trusted: orders created before they
+    existed must be populated once by ``manage.py check_delivery_counters --repair``, otherwise their
+    delivered items are listed as outstanding.
+    """
+    status = 'pick_goods'
+
+    def __init__(self, orders, ordering=None):
+        if isinstance(orders, (list, tuple)):
+            orders = OrderModel.objects.filter(pk__in=[getattr(order, 'pk', order) for order in orders])
+        self.orders = orders.filter(status=self.status)
+        self.ordering = tuple(ordering or app_settings.PICKING_LIST_ORDERING)
+        self.line_fields = self.ordering + tuple(
+            f for f in ('product', 'product_code', 'product_name') if f not in self.ordering)
+        self.lines, self.slips = OrderedDict(), OrderedDict()
+        self._built = False
+
+    def get_items(self):
+        """
+        Returns the items of the orders, which have not been delivered completely.
+        """
+        items = OrderItemModel.objects.filter(order__in=self.orders, quantity__gt=F('delivered_quantity'))
+        if any(f.attname == 'canceled' for f in OrderItemModel._meta.fields):
+            items = items.filter(canceled=False)
+        return items
+
+    def get_lines(self):
+        """
+        Returns the lines of the picking list, each one annotated with its `outstanding` quantity.
+        """
+        quantity_field = OrderItemModel._meta.get_field('quantity')
+        return self.get_items().order_by().values(*self.line_fields).annotate(
+            outstanding=Sum(F('quantity') - F('delivered_quantity'), output_field=quantity_field),
+        ).order_by(*self.line_fields)
+
+    def get_slip_items(self):
+        fields = self.line_fields + ('order', 'quantity', 'delivered_quantity')
+        return self.get_items().order_by(*(self.ordering + ('order', 'pk'))).values(*fields)
+
+    def build(self):
+        if self._built:
+            return self
+        orders = OrderedDict((order.pk, order) for order in self.orders.order_by('pk'))
+        for order in orders.values():
+            self.slips[order.pk] = {'order': order, 'items': [], 'quantity': 0}
+        line_orders = {}
+        for item in self.get_slip_items().iterator():
+            order = orders[item['order']]
+            outstanding = item['quantity'] - item.pop('delivered_quantity')
+            key = tuple(item[f] for f in self.line_fields)
+            if order not in line_orders.setdefault(key, []):
+                line_orders[key].append(order)
+            slip = self.slips[order.pk]
+            slip['items'].append(dict(item, quantity=outstanding, order=order))
+            slip['quantity'] += outstanding
+        for line in self.get_lines():
+            key = tuple(line[f] for f in self.line_fields)
+            line['quantity'], line['orders'] = line.pop('outstanding'), line_orders.get(key, [])
+            self.lines[key] = line
+        for pk in [pk for pk, slip in self.slips.items() if not slip['items']]:
+            del self.slips[pk]
+        self._built = True
+        return self
+
+    def get_template(self):
+        app_label = app_settings.APP_LABEL.lower()
+        return template_registry.get_template((app_label, None, 'print-picking-list'), [
+            '{}/print/picking-list.html'.format(app_label),
+            'edw_shop/print/picking-list.html',
+        ])
+
+    def render(self, request=None, packing_slips=True):
+        """
+        Render the picking list, optionally followed by one packing slip per order.
+        """
+        self.build()
+        return self.get_template().render({
+            'lines': list(self.lines.values()),
+            'slips': list(self.slips.values()) if packing_slips else [],
+            'render_label': 'print',
+        }, request)
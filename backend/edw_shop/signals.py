@@ -0,0 +1,9 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.dispatch import Signal
+
+
+# Sent once after a batch of orders has been moved through a transition by
+# `OrderManager.bulk_transition`. `results` is the list of per order results.
+orders_transitioned = Signal(providing_args=['transition', 'results', 'user'])
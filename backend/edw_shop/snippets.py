@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+"""
+Bulk warm-up of the cached HTML snippets rendered by ``ProductSerializer.render_html``.
+"""
+from __future__ import unicode_literals
+
+import multiprocessing
+
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.db import connections
+
+from edw_shop.conf import app_settings
+from edw_shop.models.product import ProductModel
+from edw_shop.rendering import emulate_request
+
+
+class SnippetWarmer(object):
+    """
+    Renders the HTML snippets of the products given by the primary keys `product_ids` for each
+    postfix and language, so that they are cached under the current revision of each product.
+    Snippets already cached for the current revision are not rendered again. With more than one
+    process the products are split into chunks of `chunk_size`, rendered by a process pool.
+    """
+    def __init__(self, product_ids, postfixes=('media',), languages=None, label='catalog',
+                 base_uri='http://localhost', processes=1, chunk_size=200):
+        self.product_ids = list(product_ids)
+        self.postfixes = tuple(postfixes)
+        self.languages = tuple(languages or (settings.LANGUAGE_CODE,))
+        self.label = label
+        self.base_uri = base_uri
+        self.processes = processes
+        self.chunk_size = chunk_size
+
+    @classmethod
+    def get_request(cls, base_uri, language):
+        request = emulate_request(base_uri, language)
+        request.user = AnonymousUser()
+        return request
+
+    @classmethod
+    def render_products(cls, product_ids, postfixes, languages, label, base_uri):
+        products = list(ProductModel.objects.filter(pk__in=product_ids))
+        if hasattr(ProductModel, 'prefetch_media'):
+            ProductModel.prefetch_media(products)
+        for language in languages:
+            serializer = app_settings.PRODUCT_SUMMARY_SERIALIZER(
+                context={'request': cls.get_request(base_uri, language)}, label=label)
+            for product in products:
+                for postfix in postfixes:
+                    serializer.render_html(product, postfix)
+        return len(products)
+
+    def get_chunks(self):
+        return [self.product_ids[i:i + self.chunk_size] for i in range(0, len(self.product_ids), self.chunk_size)]
+
+    def __iter__(self):
+        """
+        Yields the number of products warmed up per chunk.
+        """
+        args = [(chunk, self.postfixes, self.languages, self.label, self.base_uri) for chunk in self.get_chunks()]
+        if self.processes > 1 and len(args) > 1:
+            # database connections must not be shared with the forked processes
+            connections.close_all()
+            pool = multiprocessing.Pool(self.processes)
+            try:
+                for count in pool.imap_unordered(_warm_chunk, args):
+                    yield count
+            finally:
+                pool.terminate()
+        else:
+            for arg in args:
+                yield _warm_chunk(arg)
+
+
+def _warm_chunk(args):
+    return SnippetWarmer.render_products(*args)
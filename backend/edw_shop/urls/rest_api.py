@@ -6,11 +6,15 @@ from rest_framework import routers
 
 from edw_shop.views.cart import CartViewSet
 from edw_shop.views.checkout import CheckoutViewSet
+from edw_shop.views.order_bulk import OrderBulkViewSet
+from edw_shop.views.product_bulk import ProductBulkViewSet
 
 
 router = routers.DefaultRouter()  # TODO: try with trailing_slash=False
 router.register(r'cart', CartViewSet, base_name='cart')
 router.register(r'checkout', CheckoutViewSet, base_name='checkout')
+router.register(r'orders', OrderBulkViewSet, base_name='orders')
+router.register(r'products', ProductBulkViewSet, base_name='products')
 
 urlpatterns = [
     url(r'^', include(router.urls)),
@@ -6,6 +6,7 @@ from __future__ import unicode_literals
 import json
 
 from django.db import transaction
+from django.utils.encoding import force_text
 from django.utils.module_loading import import_string
 
 from rest_framework import status
@@ -15,6 +16,7 @@ from rest_framework.viewsets import GenericViewSet
 
 from edw_shop.conf import app_settings
 from edw_shop.models.cart import CartModel
+from edw_shop.models.order import OrderModel
 from edw_shop.modifiers.pool import cart_modifiers_pool
 from edw_shop.serializers.cart import CartSummarySerializer
 #from edw_shop.serializers.checkout import CheckoutSerializer
@@ -98,6 +100,14 @@ class CheckoutViewSet(GenericViewSet):
         return Response(data=response_data)
 
 
+    def get_purchase_key(self, request):
+        """
+        Return the idempotency key sent by the client, either as HTTP header ``Idempotency-Key``
+        or as field ``idempotency_key`` in the payload.
+        """
+        key = request.META.get('HTTP_IDEMPOTENCY_KEY') or request.data.get('idempotency_key')
+        return force_text(key)[:64] if key else None
+
     @action(detail=False, methods=['post'], url_path='purchase')
     def purchase(self, request):
 
@@ -106,18 +116,41 @@ class CheckoutViewSet(GenericViewSet):
         This is the final step on converting a cart into an order object. It normally is used in
         combination with the plugin :class:`shop.cascade.checkout.ProceedButtonPlugin` to render
         a button labeled "Purchase Now".
+
+        Clients may retry this request with the same idempotency key. Then the response stored
+        with the order created by the first request is returned, without touching the cart again.
         """
         cart = CartModel.objects.get_from_request(request)
-        cart.update(request)
-        cart.save()
-
-        response_data = {}
-        # Iterate over the registered modifiers, and search for the active payment service provider
-        for modifier in cart_modifiers_pool.get_payment_modifiers():
-            if modifier.is_active(cart):
-                payment_provider = getattr(modifier, 'payment_provider', None)
-                if payment_provider:
-                    expression = payment_provider.get_payment_request(cart, request)
-                    response_data.update(expression=expression)
-                break
+        purchase_key = self.get_purchase_key(request)
+        if purchase_key:
+            order = OrderModel.objects.filter(customer_id=cart.customer_id, purchase_key=purchase_key).first()
+            if order is not None:
+                return Response(data=order.purchase_response)
+
+        with transaction.atomic():
+            # lock the cart row, so that concurrent retries of the same purchase are serialized
+            cart = CartModel.objects.select_for_update().get(pk=cart.pk)
+            request._cached_cart = cart
+            if purchase_key:
+                order = OrderModel.objects.filter(customer_id=cart.customer_id, purchase_key=purchase_key).first()
+                if order is not None:
+                    return Response(data=order.purchase_response)
+
+            cart.update(request)
+            cart.save()
+
+            response_data = {}
+            # Iterate over the registered modifiers, and search for the active payment service provider
+            for modifier in cart_modifiers_pool.get_payment_modifiers():
+                if modifier.is_active(cart):
+                    payment_provider = getattr(modifier, 'payment_provider', None)
+                    if payment_provider:
+                        expression = payment_provider.get_payment_request(cart, request)
+                        response_data.update(expression=expression)
+                    break
+
+            order = getattr(request, '_created_order', None)
+            if purchase_key and order is not None:
+                OrderModel.objects.filter(pk=order.pk).update(
+                    purchase_key=purchase_key, purchase_response=response_data)
         return Response(data=response_data)
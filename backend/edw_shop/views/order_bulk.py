@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.http import StreamingHttpResponse
+from django.utils.dateparse import parse_datetime
+
+from rest_framework import status
+from rest_framework.decorators import action
+from rest_framework.permissions import IsAdminUser
+from rest_framework.response import Response
+from rest_framework.viewsets import GenericViewSet
+
+from edw_shop.export import EXPORT_WRITERS, OrderExporter
+from edw_shop.models.order import OrderModel
+from edw_shop.serializers.order import OrderBulkTransitionSerializer
+
+
+class OrderBulkViewSet(GenericViewSet):
+    """
+    REST endpoints for staff operating on many orders at once.
+    """
+    permission_classes = (IsAdminUser,)
+    serializer_class = OrderBulkTransitionSerializer
+
+    def get_queryset(self):
+        return OrderModel.objects.all()
+
+    @action(detail=False, methods=['post'], url_path='transition')
+    def transition(self, request):
+        """
+        Move the orders referred by `ids` through the transition named `transition`.
+        Returns the result for each order.
+        """
+        serializer = OrderBulkTransitionSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        results = OrderModel.objects.bulk_transition(
+            serializer.validated_data['ids'], serializer.validated_data['transition'], user=request.user)
+        failed = any(result['error'] is not None for result in results)
+        return Response({'results': results}, status=status.HTTP_207_MULTI_STATUS if failed else status.HTTP_200_OK)
+
+    @action(detail=False, methods=['get'], url_path='transitions')
+    def transitions(self, request):
+        """
+        Returns the names of the transitions applicable on each of the orders given by the
+        comma separated query parameter `ids`.
+        """
+        ids = [pk for pk in request.query_params.get('ids', '').split(',') if pk.strip().isdigit()]
+        orders = OrderModel.objects.filter(pk__in=ids)
+        available = OrderModel.objects.get_available_transitions(orders, user=request.user)
+        return Response([{'id': pk, 'transitions': names} for pk, names in available.items()])
+
+    @action(detail=False, methods=['get'], url_path='export')
+    def export(self, request):
+        """
+        Streams all orders updated after the optional query parameter `since` (ISO 8601), as
+        CSV or JSON Lines depending on the query parameter `type`.
+        """
+        writer_class = EXPORT_WRITERS.get(request.query_params.get('type', 'jsonl'))
+        if writer_class is None:
+            return Response({'type': "Unknown export type."}, status=status.HTTP_400_BAD_REQUEST)
+        since = request.query_params.get('since')
+        if since:
+            since = parse_datetime(since)
+            if since is None:
+                return Response({'since': "Invalid timestamp."}, status=status.HTTP_400_BAD_REQUEST)
+        since_pk = request.query_params.get('since_pk')
+        exporter = OrderExporter(since=since or None, since_pk=int(since_pk) if since_pk and since_pk.isdigit() else None)
+        writer = writer_class()
+        response = StreamingHttpResponse(writer.iter_lines(exporter), content_type=writer.content_type)
+        response['Content-Disposition'] = 'attachment; filename="orders.{}"'.format(writer.extension)
+        return response
@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from rest_framework import status
+from rest_framework.decorators import action
+from rest_framework.permissions import IsAdminUser
+from rest_framework.response import Response
+from rest_framework.viewsets import GenericViewSet
+
+from edw_shop.cache import product_cache
+from edw_shop.exchange.stock import StockUpdater
+from edw_shop.models.product import ProductModel
+from edw_shop.serializers.product import ProductStockUpdateSerializer
+
+
+class ProductBulkViewSet(GenericViewSet):
+    """
+    REST endpoints for staff and exchange systems operating on many products at once.
+    """
+    permission_classes = (IsAdminUser,)
+    serializer_class = ProductStockUpdateSerializer
+
+    def get_queryset(self):
+        return ProductModel.objects.all()
+
+    @action(detail=False, methods=['post'], url_path='stock')
+    def stock(self, request):
+        """
+        Update `in_stock` and `unit_price` of the products referred by the column `key` of each
+        item. Returns the statistics and the errors of the rejected items.
+        """
+        serializer = ProductStockUpdateSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        updater = StockUpdater(key=serializer.validated_data['key'])
+        stats = updater.update(serializer.validated_data['items'])
+        return Response({'stats': stats, 'errors': updater.errors},
+                        status=status.HTTP_207_MULTI_STATUS if updater.errors else status.HTTP_200_OK)
+
+    @action(detail=False, methods=['get'], url_path='cache-stats')
+    def cache_stats(self, request):
+        """
+        Returns the hit and miss counters of the product snippet and summary cache of the process
+        serving this request.
+        """
+        return Response(product_cache.get_stats())